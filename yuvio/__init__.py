@@ -1,10 +1,14 @@
 from .core import FormatManager
 from .core import colorspaces
+from .core import converters
 
 pixel_formats = FormatManager()
 
 from .core.functions import imread, mimread, imwrite, mimwrite
 from .core.functions import get_reader, get_writer
+from .core.functions import get_y4m_reader, get_y4m_writer
+from .core.functions import convert, convert_bitdepth
+from .core.functions import checksum, compare, stats
 from .core.functions import frame, empty, zeros, ones, from_rgb
-from .core.functions import to_rgb, from_rgb
+from .core.functions import to_rgb, from_rgb, iter_rgb
 from . import formats
@@ -1,5 +1,7 @@
-from .format import Format, FormatManager
+from .format import Format, FormatManager, FrameLayout, PlaneLayout
 from .colorspace import Colorspace, colorspaces
-from .yuv import YUVFrame
-from .reader import Reader
-from .writer import Writer
+from .converter import ConverterManager, converters
+from .yuv import YUVFrame, YUVBatch
+from .pool import BufferPool
+from .reader import Reader, FrameSequence
+from .writer import Writer, AsyncWriter
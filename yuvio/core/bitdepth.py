@@ -0,0 +1,106 @@
+from typing import Optional
+import numpy as np
+from . import Format
+from .converter import Converter
+
+
+_MODES = ('round', 'truncate', 'dither')
+
+# 8x8 ordered dither (Bayer) matrix with the thresholds 0..63.
+_BAYER = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21]
+], dtype=np.uint16)
+
+
+def bitdepth_dtype(bitdepth: int) -> np.dtype:
+    """Native sample dtype of the given bitdepth."""
+    return np.dtype(np.uint8 if bitdepth <= 8 else np.uint16)
+
+
+def _dither_thresholds(shape, shift):
+    """Bayer thresholds scaled to [0, 2 ** shift) and tiled to the last two axes of shape."""
+    height, width = shape[-2:]
+    thresholds = (_BAYER.astype(np.uint32) << shift) >> 6
+    return np.tile(thresholds.astype(np.uint16), (-(-height // 8), -(-width // 8)))[:height, :width]
+
+
+def convert_bitdepth(plane: np.ndarray, src_bitdepth: int, dst_bitdepth: int, mode: str = 'round',
+                     out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Convert the samples of a plane from src_bitdepth to dst_bitdepth.
+
+    Down-conversion rounds to the nearest value, truncates the low bits or adds an ordered dither
+    before truncating. Up-conversion shifts the samples left. The result is written to out, which
+    may be the plane itself if its dtype holds dst_bitdepth samples."""
+    if mode not in _MODES:
+        raise ValueError(f"Unknown bitdepth conversion mode '{mode}', use one of {_MODES}.")
+    if out is None:
+        out = np.empty(plane.shape, dtype=bitdepth_dtype(dst_bitdepth))
+    elif out.shape != plane.shape:
+        raise ValueError(f"The output shape {out.shape} does not match the plane shape {plane.shape}.")
+
+    shift = abs(src_bitdepth - dst_bitdepth)
+    if shift == 0:
+        np.copyto(out, plane, casting='unsafe')
+        return out
+    if dst_bitdepth > src_bitdepth:
+        np.copyto(out, plane, casting='unsafe')
+        out <<= shift
+        return out
+    if mode == 'truncate':
+        np.right_shift(plane, shift, out=out, casting='unsafe')
+        return out
+
+    # Rounding and dithering may carry into dst_bitdepth + 1 bits, work in the source width
+    # and clip before narrowing. The work buffer is the output itself if it is wide enough.
+    max_value = (1 << dst_bitdepth) - 1
+    work = out if out.dtype.itemsize >= 2 else np.empty(plane.shape, dtype=np.uint16)
+    if mode == 'round':
+        # (x >> s) + ((x >> (s - 1)) & 1) == ((x >> (s - 1)) + 1) >> 1, which only overflows
+        # 16 bits for 16 bit samples shifted by one.
+        np.right_shift(plane, shift - 1, out=work, casting='unsafe')
+        if src_bitdepth - shift + 1 < 16:
+            work += 1
+            work >>= 1
+        else:
+            carry = work & 1
+            work >>= 1
+            work += carry
+    else:
+        # floor((x + t) / 2 ** s) == (x >> s) + (((x & (2 ** s - 1)) + t) >> s) without overflow.
+        # The high bits are taken before masking, as work may be the plane itself.
+        high = np.right_shift(plane, shift, dtype=work.dtype, casting='unsafe')
+        np.bitwise_and(plane, (1 << shift) - 1, out=work, casting='unsafe')
+        work += _dither_thresholds(plane.shape, shift)
+        work >>= shift
+        work += high
+    np.minimum(work, max_value, out=work)
+    if work is not out:
+        np.copyto(out, work, casting='unsafe')
+    return out
+
+
+def bitdepth_converter(mode: str = 'round') -> Converter:
+    """Return a converter between formats with the same chroma subsampling and different bitdepths."""
+    if mode not in _MODES:
+        raise ValueError(f"Unknown bitdepth conversion mode '{mode}', use one of {_MODES}.")
+
+    def convert(data: np.ndarray, src_format: Format, dst_format: Format) -> np.ndarray:
+        planes = []
+        for plane in src_format.unpack(data):
+            if plane is None:
+                planes.append(None)
+                continue
+            # Planes unpacked into new arrays are converted in place if their dtype allows.
+            inplace = not np.may_share_memory(plane, data) and plane.dtype == bitdepth_dtype(dst_format.bitdepth())
+            planes.append(convert_bitdepth(plane, src_format.bitdepth(), dst_format.bitdepth(), mode,
+                                           out=plane if inplace else None))
+        return dst_format.pack(tuple(planes))
+
+    return convert
@@ -0,0 +1,97 @@
+from typing import Iterator, Tuple, Union
+import hashlib
+import numpy as np
+from . import Format
+from .reader import Reader
+from .parallel import executor
+
+
+# Number of bytes read and hashed at once.
+_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def _fixed_length_algorithms():
+    """Available hash algorithms that can be constructed and have a fixed digest size."""
+    algorithms = []
+    for algo in sorted(hashlib.algorithms_available):
+        try:
+            if hashlib.new(algo).digest_size > 0:
+                algorithms.append(algo)
+        except ValueError:
+            pass
+    return algorithms
+
+
+def _validate_algorithm(algo):
+    try:
+        supported = hashlib.new(algo).digest_size > 0
+    except (ValueError, TypeError):
+        supported = False
+    if not supported:
+        raise ValueError(f"Unsupported hash algorithm '{algo}', use one of {_fixed_length_algorithms()}.")
+
+
+def _hexdigest(buffers, algo):
+    digests = []
+    for buffer in buffers:
+        hasher = hashlib.new(algo)
+        hasher.update(buffer)
+        digests.append(hasher.hexdigest())
+    return digests
+
+
+def _frame_buffers(data: np.ndarray, yuv_format: Format, planes: bool):
+    """Buffers to hash per frame, the packed frame or its components in storage order."""
+    if not planes:
+        return [[data[i:i + 1]] for i in range(len(data))]
+    components = [component for component in yuv_format.unpack(data)[:3]
+                  if component is not None and component.size > 0]
+    return [[np.ascontiguousarray(component[i]) for component in components] for i in range(len(data))]
+
+
+def frame_checksums(reader: Reader, planes: bool = False, algo: str = 'md5',
+                    threads: int = 1) -> Iterator[Union[str, Tuple[str, ...]]]:
+    """Yield the hex digest of every frame of the reader, or a tuple of the digests of its
+    components if planes is True. Frames are read in large chunks and, with threads > 1,
+    hashed in parallel."""
+    _validate_algorithm(algo)
+    yuv_format = reader.format
+    chunk_count = max(1, _CHUNK_SIZE // yuv_format.layout.itemsize)
+    buffer = np.empty(chunk_count, dtype=yuv_format.layout.dtype)
+    index = 0
+    while reader.streaming or index < len(reader):
+        count = chunk_count if reader.streaming else min(chunk_count, len(reader) - index)
+        data = reader.read_data_into(index, buffer[:count])
+        if len(data) == 0:
+            return
+        frames = _frame_buffers(data, yuv_format, planes)
+        if threads > 1:
+            digests = executor(threads).map(_hexdigest, frames, [algo] * len(frames))
+        else:
+            digests = (_hexdigest(buffers, algo) for buffers in frames)
+        for digest in digests:
+            yield tuple(digest) if planes else digest[0]
+        index += len(data)
+
+
+def write_framehash(file, checksums, yuv_format: Format, algo: str = 'md5',
+                    framerate: Tuple[int, int] = (25, 1)):
+    """Write checksums in the layout of ffmpeg's framemd5/framehash muxers (version 2), with one
+    hash column per component for per-plane checksums."""
+    width, height = yuv_format.resolution
+    file.write("#format: frame checksums\n"
+               "#version: 2\n"
+               f"#hash: {algo.upper()}\n"
+               f"#tb 0: {framerate[1]}/{framerate[0]}\n"
+               "#media_type 0: video\n"
+               "#codec_id 0: rawvideo\n"
+               f"#dimensions 0: {width}x{height}\n"
+               "#sar 0: 0/1\n")
+    columns = None
+    for index, checksum in enumerate(checksums):
+        if columns is None:
+            columns = "hash" if isinstance(checksum, str) else ", ".join(
+                f"hash_{name}" for name in ('y', 'u', 'v')[:len(checksum)])
+            file.write(f"#stream#, dts,        pts, duration,     size, {columns}\n")
+        hashes = checksum if isinstance(checksum, str) else ", ".join(checksum)
+        file.write("0, {:10d}, {:10d}, {:8d}, {:8d}, {}\n".format(index, index, 1, yuv_format.layout.itemsize, hashes))
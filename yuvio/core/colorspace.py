@@ -1,6 +1,67 @@
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 import numpy as np
 from . import Format
+from .parallel import parallel_for
+
+
+_UPSAMPLING = ('nearest', 'bilinear')
+_LAYOUTS = ('hwc', 'chw')
+
+# Intermediate values per tile of the colorspace conversion, sized to stay within the L2 cache.
+_TILE_BYTES = 1 << 20
+
+# Position of the chroma samples relative to the luma samples as (horizontal, vertical).
+# 'cosited' chroma samples coincide with the first luma sample they cover, 'centered'
+# samples lie between the luma samples they cover.
+_CHROMA_SITING = {
+    'left': ('cosited', 'centered'),  # MPEG-2, H.264/HEVC default
+    'center': ('centered', 'centered'),  # JPEG, MPEG-1
+    'topleft': ('cosited', 'cosited'),  # BT.2020 4:2:0, all 4:2:2
+}
+
+
+def _phases(factor, siting):
+    """Interpolation weights in quarters per output phase as [(neighbor offset, weight), ...]."""
+    if factor == 1 or siting == 'nearest':
+        return [[(0, 4)]] * factor
+    if siting == 'cosited':
+        return [[(0, 4)], [(0, 2), (1, 2)]]
+    return [[(0, 3), (-1, 1)], [(0, 3), (1, 1)]]
+
+
+def _shifted(chroma, offset, axis):
+    """Neighboring chroma samples along axis with replicated edges."""
+    if offset == 0:
+        return chroma
+    size = chroma.shape[axis]
+    return np.take(chroma, np.clip(np.arange(size) + offset, 0, size - 1), axis=axis)
+
+
+def _add_upsampled(luma, chroma, sub_w, sub_h, phases):
+    """Return luma + chroma upsampled by (sub_w, sub_h) without materializing the upsampled chroma."""
+    height, width = chroma.shape[-2:]
+    if luma.shape[-2:] != (height * sub_h, width * sub_w):
+        raise ValueError("The luma resolution {} is not the chroma resolution {} upsampled by {}."
+                         .format(luma.shape[-2:], chroma.shape[-2:], (sub_w, sub_h)))
+    shape = luma.shape[:-2] + (height, sub_h, width, sub_w)
+    out = np.empty(luma.shape, dtype=luma.dtype)
+    out_phases = out.reshape(shape)
+    luma_phases = luma.reshape(shape)
+    horizontal_phases, vertical_phases = phases
+    if all(len(phase) == 1 for phase in horizontal_phases + vertical_phases):
+        np.add(luma_phases, chroma[..., :, None, :, None], out=out_phases)
+        return out
+
+    for phase_y, vertical in enumerate(vertical_phases):
+        for phase_x, horizontal in enumerate(horizontal_phases):
+            interpolated = np.zeros(chroma.shape, dtype=chroma.dtype)
+            for offset_y, weight_y in vertical:
+                for offset_x, weight_x in horizontal:
+                    neighbors = _shifted(_shifted(chroma, offset_y, -2), offset_x, -1)
+                    interpolated += weight_y * weight_x * neighbors
+            interpolated >>= 4
+            np.add(luma_phases[..., :, phase_y, :, phase_x], interpolated, out=out_phases[..., :, phase_y, :, phase_x])
+    return out
 
 
 class Colorspace:
@@ -39,72 +100,197 @@ class Colorspace:
                                        inv_d_fromrgb_16bit, inv_e_fromrgb_16bit,
                                        y_scale_fromrgb_16bit, cbcr_scale_fromrgb_16bit]
 
-    def to_rgb(self, y, u, v, yuv_format: Format) -> np.ndarray:
-        if yuv_format.chroma_subsampling()[0] != 1 or yuv_format.chroma_subsampling()[1] != 1:
-            raise ValueError("Color conversion is only possible for 444 yuv (ycbcr) formats (no chroma subsampling). "
-                             f"'{yuv_format.identifier()}' entails chroma subsampling.")
+    def _to_rgb_dtype(self, bitdepth, upsampling):
+        """Narrowest integer dtype that holds all intermediate values of to_rgb."""
+        (y_scale_torgb_16bit,
+         d_torgb_16bit, e_torgb_16bit,
+         ae_b_torgb_16bit, cd_b_torgb_16bit) = self._to_rgb_coefficients
+        luma_bound = ((1 << bitdepth) - 1) * y_scale_torgb_16bit
+        chroma_bound = (1 << (bitdepth - 1)) * max(d_torgb_16bit, e_torgb_16bit, ae_b_torgb_16bit + cd_b_torgb_16bit)
+        # Bilinear interpolation accumulates 16 weighted chroma samples before normalizing.
+        bound = max(luma_bound + chroma_bound, 16 * chroma_bound if upsampling == 'bilinear' else 0)
+        return np.int32 if bound < 2 ** 31 else np.int64
+
+    def to_rgb(self, y, u, v, yuv_format: Format,
+               upsampling: str = 'nearest', chroma_siting: str = 'left',
+               threads: int = 1, out: Optional[np.ndarray] = None, layout: str = 'hwc') -> np.ndarray:
+        sub_w, sub_h = yuv_format.chroma_subsampling()
+        if sub_w == 0 and sub_h == 0:
+            raise ValueError("Color conversion requires chroma components, "
+                             f"'{yuv_format.identifier()}' has none.")
+        if upsampling not in _UPSAMPLING:
+            raise ValueError(f"Unknown chroma upsampling '{upsampling}', use one of {_UPSAMPLING}.")
+        if chroma_siting not in _CHROMA_SITING:
+            raise ValueError(f"Unknown chroma siting '{chroma_siting}', use one of {tuple(_CHROMA_SITING)}.")
+        if layout not in _LAYOUTS:
+            raise ValueError(f"Unknown rgb layout '{layout}', use one of {_LAYOUTS}.")
         bitdepth = yuv_format.bitdepth()
-        max_value = 2 ** bitdepth - 1
-        dtype = y.dtype
+        work_dtype = self._to_rgb_dtype(bitdepth, upsampling)
+        horizontal, vertical = _CHROMA_SITING[chroma_siting]
+        phases = (_phases(sub_w, horizontal if upsampling == 'bilinear' else 'nearest'),
+                  _phases(sub_h, vertical if upsampling == 'bilinear' else 'nearest'))
+        # Bilinear vertical interpolation reads one neighboring chroma row above and below.
+        halo = 1 if any(len(phase) > 1 for phase in phases[1]) else 0
+
+        # Frames of a batch are converted in tiles of whole chroma rows, so that the
+        # intermediate values stay cache-sized and tiles can be distributed across threads.
+        shape = y.shape[:-2] + ((3,) + y.shape[-2:] if layout == 'chw' else y.shape[-2:] + (3,))
+        if out is None:
+            out = np.empty(shape, dtype=y.dtype.newbyteorder('='))
+        elif out.shape != shape:
+            raise ValueError(f"The output shape {out.shape} does not match the expected shape {shape}.")
+        channels = [out[..., channel, :, :] if layout == 'chw' else out[..., channel] for channel in range(3)]
+        chroma_height, chroma_width = u.shape[-2:]
+        tile_rows = _tile_rows(chroma_width * sub_w * sub_h * np.dtype(work_dtype).itemsize, chroma_height)
+        tiles = [(frame, row) for frame in np.ndindex(y.shape[:-2]) for row in range(0, chroma_height, tile_rows)]
 
-        y = y.astype(np.int64)
-        u = u.astype(np.int64)
-        v = v.astype(np.int64)
+        def convert(start, stop):
+            for frame, row in tiles[start:stop]:
+                low = max(row - halo, 0)
+                high = min(row + tile_rows + halo, chroma_height)
+                rgb = self._to_rgb_tile(y[frame][low * sub_h:high * sub_h], u[frame][low:high], v[frame][low:high],
+                                        bitdepth, work_dtype, sub_w, sub_h, phases)
+                rows = slice((row - low) * sub_h, (min(row + tile_rows, chroma_height) - low) * sub_h)
+                for channel, values in zip(channels, rgb):
+                    channel[frame][row * sub_h:(row + tile_rows) * sub_h] = values[rows]
 
-        # Color conversion
+        parallel_for(convert, len(tiles), threads)
+        return out
+
+    def _to_rgb_tile(self, y, u, v, bitdepth, work_dtype, sub_w, sub_h, phases):
+        """Clipped r, g, b in work_dtype for one tile of whole chroma rows."""
+        max_value = 2 ** bitdepth - 1
+
+        # Color conversion in the narrowest integer width that cannot overflow. The chroma
+        # contributions are computed at chroma resolution and upsampled while adding them
+        # to the luma contribution.
         y_offset = self._y_baserange[0] << (bitdepth - 8)
         chroma_center = 128 << (bitdepth - 8)
 
-        y = (y - y_offset)
-        u = (u - chroma_center)
-        v = (v - chroma_center)
-
         (y_scale_torgb_16bit,
          d_torgb_16bit, e_torgb_16bit,
          ae_b_torgb_16bit, cd_b_torgb_16bit) = self._to_rgb_coefficients
-        y_16bit = y * y_scale_torgb_16bit
-        r = (y_16bit + e_torgb_16bit * v) >> 16
-        g = (y_16bit - ae_b_torgb_16bit * v - cd_b_torgb_16bit * u) >> 16
-        b = (y_16bit + d_torgb_16bit * u) >> 16
+        y_16bit = y.astype(work_dtype)
+        y_16bit -= y_offset
+        y_16bit *= y_scale_torgb_16bit
+
+        u = u.astype(work_dtype)
+        u -= chroma_center
+        v = v.astype(work_dtype)
+        v -= chroma_center
+        r_chroma = e_torgb_16bit * v
+        g_chroma = -ae_b_torgb_16bit * v
+        g_chroma -= cd_b_torgb_16bit * u
+        b_chroma = d_torgb_16bit * u
 
-        r = np.clip(r, 0, max_value).astype(dtype)
-        g = np.clip(g, 0, max_value).astype(dtype)
-        b = np.clip(b, 0, max_value).astype(dtype)
+        r = _add_upsampled(y_16bit, r_chroma, sub_w, sub_h, phases)
+        g = _add_upsampled(y_16bit, g_chroma, sub_w, sub_h, phases)
+        b = _add_upsampled(y_16bit, b_chroma, sub_w, sub_h, phases)
 
-        return np.stack((r, g, b), axis=-1)
+        for channel in (r, g, b):
+            np.right_shift(channel, 16, out=channel)
+            np.clip(channel, 0, max_value, out=channel)
+        return r, g, b
 
-    def from_rgb(self, rgb_frame: np.ndarray, yuv_format: Format) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-        if yuv_format.chroma_subsampling()[0] != 1 or yuv_format.chroma_subsampling()[1] != 1:
-            raise ValueError("Color conversion is only possible for 444 yuv (ycbcr) formats (no chroma subsampling). "
-                             f"'{yuv_format.identifier()}' entails chroma subsampling.")
+    def from_rgb(self, rgb_frame: np.ndarray, yuv_format: Format, threads: int = 1,
+                 out: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        sub_w, sub_h = yuv_format.chroma_subsampling()
+        if sub_w == 0 and sub_h == 0:
+            raise ValueError("Color conversion requires chroma components, "
+                             f"'{yuv_format.identifier()}' has none.")
+        height, width = rgb_frame.shape[-3:-1]
+        if height % sub_h != 0 or width % sub_w != 0:
+            raise ValueError(f"The resolution ({width}, {height}) is not divisible by the chroma subsampling "
+                             f"({sub_w}, {sub_h}) of '{yuv_format.identifier()}'.")
         bitdepth = yuv_format.bitdepth()
-        rgb = rgb_frame.astype(np.int64)
+        dtype = np.uint8 if bitdepth <= 8 else np.uint16
+
+        # Frames of a batch are converted in tiles of whole chroma rows, see to_rgb.
+        leading = rgb_frame.shape[:-3]
+        chroma_height = height // sub_h
+        shapes = (leading + (height, width),) + 2 * (leading + (chroma_height, width // sub_w),)
+        if out is None:
+            out = tuple(np.empty(shape, dtype=dtype) for shape in shapes)
+        elif any(plane is None or plane.shape != shape for plane, shape in zip(out, shapes)):
+            raise ValueError(f"The output planes do not match the expected shapes {shapes}.")
+        y, u, v = out
+        tile_rows = _tile_rows(width * sub_h * 3 * np.dtype(np.int64).itemsize, chroma_height)
+        tiles = [(frame, row) for frame in np.ndindex(leading) for row in range(0, chroma_height, tile_rows)]
+
+        def convert(start, stop):
+            for frame, row in tiles[start:stop]:
+                rows = slice(row, row + tile_rows)
+                luma_rows = slice(row * sub_h, (row + tile_rows) * sub_h)
+                y[frame][luma_rows], u[frame][rows], v[frame][rows] = self._from_rgb_tile(
+                    rgb_frame[frame][luma_rows], bitdepth, sub_w, sub_h)
+
+        parallel_for(convert, len(tiles), threads)
+        return y, u, v
 
+    def _from_rgb_tile(self, rgb_frame, bitdepth, sub_w, sub_h):
+        """y, u, v in int64 for one tile of whole chroma rows."""
+        height, width = rgb_frame.shape[-3:-1]
         (a_fromrgb_16bit, b_fromrgb_16bit, c_fromrgb_16bit,
          inv_d_fromrgb_16bit, inv_e_fromrgb_16bit,
          y_scale_fromrgb_16bit, cbcr_scale_fromrgb_16bit) = self._from_rgb_coefficients
 
-        y = a_fromrgb_16bit * rgb[..., 0] + b_fromrgb_16bit * rgb[..., 1] + c_fromrgb_16bit * rgb[..., 2]
-        u = (((rgb[..., 2] << 16) - y) * inv_d_fromrgb_16bit) >> 16
-        v = (((rgb[..., 0] << 16) - y) * inv_e_fromrgb_16bit) >> 16
+        # The products exceed 32 bits, keep int64 but work in place to limit the temporaries.
+        y = _weighted_sum(rgb_frame, a_fromrgb_16bit, b_fromrgb_16bit, c_fromrgb_16bit)
+        if sub_w == 1 and sub_h == 1:
+            rgb = rgb_frame
+            y_chroma = y
+        else:
+            # Chroma is computed directly at chroma resolution from the rounded mean of each
+            # block of RGB samples it covers.
+            blocks = rgb_frame.reshape(rgb_frame.shape[:-3] + (height // sub_h, sub_h, width // sub_w, sub_w, 3))
+            count = sub_w * sub_h
+            rgb = blocks.sum(axis=(-4, -2), dtype=np.int64)
+            rgb += count // 2
+            rgb //= count
+            y_chroma = _weighted_sum(rgb, a_fromrgb_16bit, b_fromrgb_16bit, c_fromrgb_16bit)
+        u = _scaled_difference(rgb[..., 2], y_chroma, inv_d_fromrgb_16bit)
+        v = _scaled_difference(rgb[..., 0], y_chroma, inv_e_fromrgb_16bit)
+        del y_chroma
 
         bitdepth_shift = bitdepth - 8
         y_low = self._y_baserange[0] << bitdepth_shift
         chroma_center = 128 << bitdepth_shift
-
-        y = ((y * y_scale_fromrgb_16bit) >> 32) + y_low
-        u = ((u * cbcr_scale_fromrgb_16bit) >> 32) + chroma_center
-        v = ((v * cbcr_scale_fromrgb_16bit) >> 32) + chroma_center
-
         clip_low = self._video_basemargin << bitdepth_shift
         clip_high = (1 << bitdepth) - 1 - clip_low
-        y = np.clip(y, clip_low, clip_high)
-        u = np.clip(u, clip_low, clip_high)
-        v = np.clip(v, clip_low, clip_high)
 
+        for plane, scale, offset in ((y, y_scale_fromrgb_16bit, y_low),
+                                     (u, cbcr_scale_fromrgb_16bit, chroma_center),
+                                     (v, cbcr_scale_fromrgb_16bit, chroma_center)):
+            plane *= scale
+            plane >>= 32
+            plane += offset
+            np.clip(plane, clip_low, clip_high, out=plane)
         return y, u, v
 
 
+def _tile_rows(row_bytes, rows):
+    """Number of rows per tile that keeps a tile of row_bytes wide rows within _TILE_BYTES."""
+    return max(1, min(rows, _TILE_BYTES // max(row_bytes, 1)))
+
+
+def _weighted_sum(rgb, a, b, c):
+    """a * r + b * g + c * b in int64."""
+    result = np.multiply(rgb[..., 0], np.int64(a), dtype=np.int64)
+    result += np.multiply(rgb[..., 1], np.int64(b), dtype=np.int64)
+    result += np.multiply(rgb[..., 2], np.int64(c), dtype=np.int64)
+    return result
+
+
+def _scaled_difference(channel, y, scale):
+    """(((channel << 16) - y) * scale) >> 16 in int64."""
+    result = np.left_shift(channel, np.int64(16), dtype=np.int64)
+    result -= y
+    result *= scale
+    result >>= 16
+    return result
+
+
 class ColorspaceManager:
     def __init__(self):
         # For colorspace parameters, see:
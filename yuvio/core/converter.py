@@ -0,0 +1,47 @@
+from typing import Callable, Dict, Tuple
+import numpy as np
+from . import Format
+
+
+# Converts data of the source format into newly allocated data of the destination format.
+Converter = Callable[[np.ndarray, Format, Format], np.ndarray]
+
+
+def unpack_pack(data: np.ndarray, src_format: Format, dst_format: Format) -> np.ndarray:
+    """Generic conversion by unpacking to separate components and packing them again."""
+    return dst_format.pack(src_format.unpack(data))
+
+
+class ConverterManager:
+    """Registry of fused converters that go directly from one packed format to another."""
+
+    def __init__(self):
+        self._converters: Dict[Tuple[str, str], Converter] = {}
+
+    def register(self, src_pix_fmt: str, dst_pix_fmt: str, converter: Converter, overwrite: bool = False):
+        key = (src_pix_fmt, dst_pix_fmt)
+        if key in self._converters and not overwrite:
+            raise KeyError("Another converter from '{}' to '{}' is registered already.".format(*key))
+        self._converters[key] = converter
+
+    def __contains__(self, item: Tuple[str, str]):
+        return item in self._converters
+
+    def __getitem__(self, key: Tuple[str, str]) -> Converter:
+        return self._converters[key]
+
+    def __str__(self):
+        return ", ".join(list(map(
+            lambda key: f"({key[0]} -> {key[1]})",
+            self._converters.keys()
+        )))
+
+    def get(self, src_format: Format, dst_format: Format) -> Converter:
+        """Return the fused converter between both formats or the generic unpack/pack conversion."""
+        return self._converters.get((src_format.identifier(), dst_format.identifier()), unpack_pack)
+
+    def convert(self, data: np.ndarray, src_format: Format, dst_format: Format) -> np.ndarray:
+        return self.get(src_format, dst_format)(data, src_format, dst_format)
+
+
+converters = ConverterManager()
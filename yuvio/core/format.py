@@ -1,13 +1,94 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Tuple, Optional
+from functools import lru_cache
+from typing import Dict, Tuple, Optional, List, NamedTuple
 import numpy as np
 
 
+class PlaneLayout(NamedTuple):
+    """Layout of one field of the frame dtype relative to the start of the frame."""
+    name: str
+    offset: int
+    shape: Tuple[int, ...]
+    strides: Tuple[int, ...]
+    dtype: np.dtype
+
+
+class FrameLayout(NamedTuple):
+    """Immutable layout of exactly one frame of a format."""
+    dtype: np.dtype
+    itemsize: int
+    planes: Tuple[PlaneLayout, ...]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            for plane in self.planes:
+                if plane.name == key:
+                    return plane
+            raise KeyError(key)
+        return tuple.__getitem__(self, key)
+
+
+def reshaped_view(array: np.ndarray, shape) -> np.ndarray:
+    """Reshape without copying, so that writes to the result reach the array."""
+    view = array.view()
+    view.shape = shape
+    return view
+
+
+def to_native_byteorder(data: np.ndarray) -> np.ndarray:
+    """Return the frames with all fields in native byte order. Writeable data is swapped
+    in place and returned as a view, read-only data is converted into a copy."""
+    native = data.dtype.newbyteorder('=')
+    if native == data.dtype:
+        return data
+    if not data.flags.writeable:
+        return data.astype(native)
+    _byteswap_fields(data)
+    return data.view(native)
+
+
+def _byteswap_fields(data: np.ndarray):
+    for name in data.dtype.names:
+        field = data[name]
+        if field.dtype.names is not None:
+            _byteswap_fields(field)
+        elif not field.dtype.isnative:
+            field.byteswap(inplace=True)
+
+
+@lru_cache(maxsize=None)
+def frame_layout(format_cls, width: int, height: int) -> FrameLayout:
+    """Return the cached layout of a frame of the given format and resolution."""
+    dtype = format_cls(width, height).dtype
+    planes = []
+    for name in dtype.names:
+        field, offset = dtype.fields[name][:2]
+        strides = []
+        stride = field.base.itemsize
+        for size in reversed(field.shape):
+            strides.insert(0, stride)
+            stride *= size
+        planes.append(PlaneLayout(name, offset, field.shape, tuple(strides), field.base))
+    return FrameLayout(dtype, dtype.itemsize, tuple(planes))
+
+
 class Format(ABC):
 
     def __init__(self, width, height):
         self._width = width
         self._height = height
+        self._layout = None
+
+    @property
+    def resolution(self) -> Tuple[int, int]:
+        return self._width, self._height
+
+    @property
+    def layout(self) -> FrameLayout:
+        """Cached layout of exactly one frame, prefer this over rebuilding dtype."""
+        if self._layout is None:
+            self._layout = frame_layout(type(self), self._width, self._height)
+        return self._layout
 
     @classmethod
     def io_info(cls) -> str:
@@ -55,17 +136,53 @@ class Format(ABC):
         """Pack the raw components into data described by dtype."""
         pass
 
+    def unpack_threaded(self, data: np.ndarray, threads: int) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+        """Unpack using up to 'threads' threads. Formats that do actual work while unpacking
+        override this, all others unpack on the calling thread."""
+        return self.unpack(data)
+
+    def pack_threaded(self, raw: Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]], threads: int) -> np.ndarray:
+        """Pack using up to 'threads' threads, see unpack_threaded."""
+        return self.pack(raw)
+
+    def planes(self, raw: Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]) -> Optional[List[np.ndarray]]:
+        """Return the raw components of a single frame as buffers in storage order
+        if they can be written without packing, otherwise None."""
+        return None
+
+    def _contiguous_planes(self, raw, names) -> Optional[List[np.ndarray]]:
+        layout = self.layout
+        for component, name in zip(raw, names):
+            plane = layout[name]
+            if component is None \
+                    or component.dtype != plane.dtype \
+                    or component.shape != plane.shape \
+                    or not component.flags.c_contiguous:
+                return None
+        return list(raw[:len(names)])
+
 
 class FormatManager:
 
     def __init__(self):
         self._formats: Dict[str, Format] = {}
+        self._instances: Dict[Tuple[str, int, int], Format] = {}
 
     def register(self, format_cls: Format, overwrite: bool = False):
         pix_fmt = format_cls.identifier()
         if pix_fmt in self._formats and not overwrite:
             raise KeyError("Another format with identifier '{}' is registered already.".format(pix_fmt))
         self._formats[pix_fmt] = format_cls
+        self._instances.clear()
+
+    def get(self, pix_fmt: str, width: int, height: int) -> Format:
+        """Return the shared format instance for the given pixel format and resolution."""
+        key = (pix_fmt, width, height)
+        yuv_format = self._instances.get(key)
+        if yuv_format is None:
+            yuv_format = self._formats[pix_fmt](width, height)
+            self._instances[key] = yuv_format
+        return yuv_format
 
     def __iter__(self):
         return iter(self._formats)
@@ -1,11 +1,19 @@
+import io
+from pathlib import Path
 import numpy as np
 from .. import pixel_formats
-from . import Reader, Writer
-from . import YUVFrame
+from . import Reader, Writer, AsyncWriter
+from . import YUVFrame, YUVBatch
 from . import colorspaces
+from .transcode import transcode
+from .y4m import Y4MReader, Y4MWriter
+from .checksum import frame_checksums, write_framehash
+from .metrics import compare_readers
+from .stats import frame_stats
+from . import bitdepth
 
 
-def imread(file, width, height, pixel_format, index=0):
+def imread(file, width, height, pixel_format, index=0, native_endian=False):
     """
     Read the yuv frame from the given file.
 
@@ -14,14 +22,16 @@ def imread(file, width, height, pixel_format, index=0):
     :param height: frame height
     :param pixel_format: ffmpeg pixel format specifier
     :param index: frame index (default: 0)
+    :param native_endian: return the components in native byte order (default: False)
     :return: yuv frame
     """
-    yuv_format = pixel_formats[pixel_format](width, height)
-    reader = Reader(file, yuv_format)
+    yuv_format = pixel_formats.get(pixel_format, width, height)
+    reader = Reader(file, yuv_format, native_endian=native_endian)
     return reader.read(index, 1)[0]
 
 
-def mimread(file, width, height, pixel_format, index=0, count=None):
+def mimread(file, width, height, pixel_format, index=0, count=None, mmap=False, max_bytes=None,
+            native_endian=False):
     """
     Read the yuv frames from the given file.
 
@@ -31,10 +41,14 @@ def mimread(file, width, height, pixel_format, index=0, count=None):
     :param pixel_format: ffmpeg pixel format specifier
     :param index: first frame index (default: 0)
     :param count: frame count (read all if None)
+    :param mmap: memory map the file instead of reading it (default: False)
+    :param max_bytes: memory budget per read, larger reads return a lazy sequence of frames (default: None,
+        reads exceeding 90% of the available memory raise a RuntimeError)
+    :param native_endian: return the components in native byte order (default: False)
     :return: list of yuv frames
     """
-    yuv_format = pixel_formats[pixel_format](width, height)
-    reader = Reader(file, yuv_format)
+    yuv_format = pixel_formats.get(pixel_format, width, height)
+    reader = Reader(file, yuv_format, mmap=mmap, max_bytes=max_bytes, native_endian=native_endian)
     return reader.read(index, count)
 
 
@@ -45,7 +59,7 @@ def imwrite(file, yuv_frame):
     :param file: str, Path, file handle
     :param yuv_frame: list of yuv frames
     """
-    yuv_format = pixel_formats[yuv_frame.pixel_format](yuv_frame.y.shape[1], yuv_frame.y.shape[0])
+    yuv_format = pixel_formats.get(yuv_frame.pixel_format, yuv_frame.y.shape[1], yuv_frame.y.shape[0])
     writer = Writer(file, yuv_format)
     writer.write(yuv_frame)
 
@@ -57,12 +71,12 @@ def mimwrite(file, yuv_frames):
     :param file: str, Path, file handle
     :param yuv_frames: list of yuv frames
     """
-    yuv_format = pixel_formats[yuv_frames[0].pixel_format](yuv_frames[0].y.shape[1], yuv_frames[0].y.shape[0])
+    yuv_format = pixel_formats.get(yuv_frames[0].pixel_format, yuv_frames[0].y.shape[1], yuv_frames[0].y.shape[0])
     writer = Writer(file, yuv_format)
     writer.write(yuv_frames)
 
 
-def get_reader(file, width, height, pixel_format):
+def get_reader(file, width, height, pixel_format, mmap=False, max_bytes=None, threads=1, native_endian=False):
     """
     Get a reader for the given file.
 
@@ -70,14 +84,20 @@ def get_reader(file, width, height, pixel_format):
     :param width: frame width
     :param height: frame height
     :param pixel_format: ffmpeg pixel format specifier
+    :param mmap: memory map the file instead of reading it (default: False)
+    :param max_bytes: memory budget per read, larger reads return a lazy sequence of frames (default: None,
+        reads exceeding 90% of the available memory raise a RuntimeError)
+    :param threads: number of threads used for unpacking (default: 1)
+    :param native_endian: return the components in native byte order (default: False)
     :return: reader
     """
-    yuv_format = pixel_formats[pixel_format](width, height)
-    reader = Reader(file, yuv_format)
+    yuv_format = pixel_formats.get(pixel_format, width, height)
+    reader = Reader(file, yuv_format, mmap=mmap, max_bytes=max_bytes, threads=threads,
+                    native_endian=native_endian)
     return reader
 
 
-def get_writer(file, width, height, pixel_format):
+def get_writer(file, width, height, pixel_format, background=False, queue_depth=8, threads=1):
     """
     Get a writer for the given file.
 
@@ -85,13 +105,166 @@ def get_writer(file, width, height, pixel_format):
     :param width: frame width
     :param height: frame height
     :param pixel_format: ffmpeg pixel format specifier
+    :param background: pack and write frames on a background thread (default: False)
+    :param queue_depth: maximum number of pending writes of a background writer (default: 8)
+    :param threads: number of threads used for packing (default: 1)
     :return: writer
     """
-    yuv_format = pixel_formats[pixel_format](width, height)
-    writer = Writer(file, yuv_format)
+    yuv_format = pixel_formats.get(pixel_format, width, height)
+    if background:
+        return AsyncWriter(file, yuv_format, queue_depth=queue_depth, threads=threads)
+    writer = Writer(file, yuv_format, threads=threads)
     return writer
 
 
+def get_y4m_reader(file, mmap=False, max_bytes=None, threads=1, native_endian=False, index_file=None):
+    """
+    Get a reader for the given y4m file. Resolution and pixel format are read from its header.
+
+    :param file: str, Path, file handle
+    :param mmap: memory map the file instead of reading it (default: False)
+    :param max_bytes: memory budget per read, larger reads return a lazy sequence of frames (default: None,
+        reads exceeding 90% of the available memory raise a RuntimeError)
+    :param threads: number of threads used for unpacking (default: 1)
+    :param native_endian: return the components in native byte order (default: False)
+    :param index_file: file to load the frame offset index from or to store it to (default: None)
+    :return: y4m reader
+    """
+    return Y4MReader(file, mmap=mmap, max_bytes=max_bytes, threads=threads, native_endian=native_endian,
+                     index_file=index_file)
+
+
+def get_y4m_writer(file, width, height, pixel_format, framerate=(25, 1), threads=1):
+    """
+    Get a writer for the given y4m file. The stream header is written immediately.
+
+    :param file: str, Path, file handle
+    :param width: frame width
+    :param height: frame height
+    :param pixel_format: ffmpeg pixel format specifier
+    :param framerate: frame rate as (numerator, denominator) (default: (25, 1))
+    :param threads: number of threads used for packing (default: 1)
+    :return: y4m writer
+    """
+    yuv_format = pixel_formats.get(pixel_format, width, height)
+    return Y4MWriter(file, yuv_format, framerate=framerate, threads=threads)
+
+
+def convert(src, dst, width, height, src_pixel_format, dst_pixel_format, workers=1, mode='round'):
+    """
+    Convert the yuv frames of a file to another pixel format with the same chroma subsampling
+    in bounded chunks.
+
+    :param src: str, Path, file handle (paths only if workers > 1)
+    :param dst: str, Path, file handle (paths only if workers > 1)
+    :param width: frame width
+    :param height: frame height
+    :param src_pixel_format: ffmpeg pixel format specifier of src
+    :param dst_pixel_format: ffmpeg pixel format specifier of dst
+    :param workers: number of worker processes (default: 1)
+    :param mode: bitdepth conversion 'round', 'truncate' or 'dither' if the bitdepths differ (default: 'round')
+    :return: number of converted frames
+    """
+    src_format = pixel_formats.get(src_pixel_format, width, height)
+    dst_format = pixel_formats.get(dst_pixel_format, width, height)
+    return transcode(src, dst, src_format, dst_format, workers=workers, mode=mode)
+
+
+def convert_bitdepth(yuv, pixel_format, mode='round', inplace=False):
+    """
+    Convert yuv data to a pixel format with the same chroma subsampling and another bitdepth.
+    Down-conversion rounds, truncates or applies an ordered dither, up-conversion shifts.
+
+    :param yuv: yuv frame or yuv batch
+    :param pixel_format: ffmpeg pixel format specifier
+    :param mode: 'round', 'truncate' or 'dither' (default: 'round')
+    :param inplace: convert the planes of yuv in place if their dtype allows (default: False)
+    :return: yuv frame or yuv batch
+    """
+    width, height = yuv.resolution
+    yuv_format = pixel_formats.get(pixel_format, width, height)
+    if yuv_format.chroma_subsampling() != yuv.yuv_format.chroma_subsampling():
+        raise ValueError(f"Cannot convert '{yuv.pixel_format}' to '{pixel_format}', "
+                         "the chroma subsampling of both formats must match.")
+    dtype = bitdepth.bitdepth_dtype(yuv_format.bitdepth())
+    planes = [None if plane is None else
+              bitdepth.convert_bitdepth(plane, yuv.yuv_format.bitdepth(), yuv_format.bitdepth(), mode,
+                                        out=plane if inplace and plane.dtype == dtype and plane.flags.writeable else None)
+              for plane in yuv.split()]
+    return type(yuv)(*planes, yuv_format)
+
+
+def checksum(file, width, height, pixel_format, planes=False, algo='md5', threads=1, output=None,
+             framerate=(25, 1)):
+    """
+    Compute a checksum of every frame of the given file.
+
+    :param file: str, Path, file handle
+    :param width: frame width
+    :param height: frame height
+    :param pixel_format: ffmpeg pixel format specifier
+    :param planes: hash the y, u and v components separately instead of the packed frame (default: False)
+    :param algo: hashlib algorithm with a fixed digest size (default: 'md5')
+    :param threads: number of threads hashing frames in parallel (default: 1)
+    :param output: str, Path or text file handle to write the checksums to in ffmpeg's framemd5 layout
+                   (default: None)
+    :param framerate: frame rate as (numerator, denominator) for the time base of the output (default: (25, 1))
+    :return: list of hex digests, or of tuples of hex digests per component if planes is True
+    """
+    yuv_format = pixel_formats.get(pixel_format, width, height)
+    reader = Reader(file, yuv_format)
+    checksums = list(frame_checksums(reader, planes=planes, algo=algo, threads=threads))
+    if output is not None:
+        if isinstance(output, io.TextIOBase):
+            write_framehash(output, checksums, yuv_format, algo=algo, framerate=framerate)
+        else:
+            with open(Path(output).expanduser(), 'w') as output_file:
+                write_framehash(output_file, checksums, yuv_format, algo=algo, framerate=framerate)
+    return checksums
+
+
+def compare(reference, distorted, width, height, pixel_format, distorted_pixel_format=None,
+            metrics=('psnr', 'ssim'), batch_size=8, threads=1):
+    """
+    Compare the yuv frames of a distorted file to a reference file frame by frame. Both files are
+    read in lockstep in batches, the results are returned as soon as a batch is evaluated.
+
+    :param reference: str, Path, file handle
+    :param distorted: str, Path, file handle
+    :param width: frame width
+    :param height: frame height
+    :param pixel_format: ffmpeg pixel format specifier of reference
+    :param distorted_pixel_format: ffmpeg pixel format specifier of distorted (default: pixel_format)
+    :param metrics: any of 'mse', 'psnr' and 'ssim' (default: ('psnr', 'ssim'))
+    :param batch_size: number of frames read at once from each file (default: 8)
+    :param threads: number of threads evaluating frames in parallel (default: 1)
+    :return: iterator over the metrics of each frame as {plane: {metric: value}}
+    """
+    reference_format = pixel_formats.get(pixel_format, width, height)
+    distorted_format = pixel_formats.get(distorted_pixel_format or pixel_format, width, height)
+    return compare_readers(Reader(reference, reference_format), Reader(distorted, distorted_format),
+                           metrics=metrics, batch_size=batch_size, threads=threads)
+
+
+def stats(file, width, height, pixel_format, histogram=True, mmap=False, threads=1):
+    """
+    Compute the minimum, maximum, mean, variance and histogram of every plane of every frame of
+    the given file. The file is read in large chunks, the results are returned as soon as a
+    chunk is evaluated.
+
+    :param file: str, Path, file handle
+    :param width: frame width
+    :param height: frame height
+    :param pixel_format: ffmpeg pixel format specifier
+    :param histogram: include the histograms with 2 ** bitdepth bins (default: True)
+    :param mmap: memory map the file instead of reading it (default: False)
+    :param threads: number of threads evaluating frames in parallel (default: 1)
+    :return: iterator over the statistics of each frame as {plane: {statistic: value}}
+    """
+    yuv_format = pixel_formats.get(pixel_format, width, height)
+    return frame_stats(Reader(file, yuv_format, mmap=mmap), histogram=histogram, threads=threads)
+
+
 def frame(yuv, pixel_format):
     """
     Initialize a new yuv frame from the given y, u, v components.
@@ -101,7 +274,7 @@ def frame(yuv, pixel_format):
     :return: yuv frame
     """
     y, u, v = yuv
-    yuv_format = pixel_formats[pixel_format](y.shape[1], y.shape[0])
+    yuv_format = pixel_formats.get(pixel_format, y.shape[1], y.shape[0])
     sub_w, sub_h = yuv_format.chroma_subsampling()
     if sub_w == 0 and sub_h == 0:
         if u is not None or v is not None:
@@ -126,8 +299,8 @@ def empty(width, height, pixel_format):
     :param pixel_format: ffmpeg pixel format specifier
     :return: yuv frame
     """
-    yuv_format = pixel_formats[pixel_format](width, height)
-    y, u, v = yuv_format.unpack(np.empty(1, dtype=yuv_format.dtype))
+    yuv_format = pixel_formats.get(pixel_format, width, height)
+    y, u, v = yuv_format.unpack(np.empty(1, dtype=yuv_format.layout.dtype))
     return YUVFrame(y[0],
                     u[0] if u is not None else None,
                     v[0] if v is not None else None,
@@ -143,8 +316,8 @@ def zeros(width, height, pixel_format):
     :param pixel_format: ffmpeg pixel format specifier
     :return: yuv frame
     """
-    yuv_format = pixel_formats[pixel_format](width, height)
-    y, u, v = yuv_format.unpack(np.zeros(1, dtype=yuv_format.dtype))
+    yuv_format = pixel_formats.get(pixel_format, width, height)
+    y, u, v = yuv_format.unpack(np.zeros(1, dtype=yuv_format.layout.dtype))
     return YUVFrame(y[0],
                     u[0] if u is not None else None,
                     v[0] if v is not None else None,
@@ -160,36 +333,80 @@ def ones(width, height, pixel_format):
     :param pixel_format: ffmpeg pixel format specifier
     :return: yuv frame
     """
-    yuv_format = pixel_formats[pixel_format](width, height)
-    y, u, v = yuv_format.unpack(np.ones(1, dtype=yuv_format.dtype))
+    yuv_format = pixel_formats.get(pixel_format, width, height)
+    y, u, v = yuv_format.unpack(np.ones(1, dtype=yuv_format.layout.dtype))
     return YUVFrame(y[0],
                     u[0] if u is not None else None,
                     v[0] if v is not None else None,
                     yuv_format)
 
 
-def to_rgb(yuv, specification='bt709', value_range='limited'):
+def to_rgb(yuv, specification='bt709', value_range='limited', upsampling='nearest', chroma_siting='left',
+           threads=1, out=None, layout='hwc'):
     """
-    Convert yuv data to rgb.
+    Convert yuv data to rgb. Subsampled chroma is upsampled as part of the conversion.
 
-    :param yuv: yuv frame
+    :param yuv: yuv frame or yuv batch
     :param specification: specification identifier (default: 'bt709')
     :param value_range: yuv value range (default: 'limited')
-    :return: rgb data
+    :param upsampling: chroma upsampling 'nearest' or 'bilinear' (default: 'nearest')
+    :param chroma_siting: chroma sample position 'left', 'center' or 'topleft' (default: 'left')
+    :param threads: number of threads converting tiles of rows in parallel (default: 1)
+    :param out: optional array the rgb data is written to, values are cast to its dtype (default: None)
+    :param layout: 'hwc' for interleaved or 'chw' for planar rgb data (default: 'hwc')
+    :return: rgb data of shape (height, width, 3) or (3, height, width) for a frame, with a leading
+             count dimension for a batch
     """
-    return colorspaces[specification, value_range].to_rgb(*yuv.split(), yuv.yuv_format)
+    return colorspaces[specification, value_range].to_rgb(*yuv.split(), yuv.yuv_format,
+                                                          upsampling=upsampling, chroma_siting=chroma_siting,
+                                                          threads=threads, out=out, layout=layout)
 
 
-def from_rgb(rgb, pixel_format, specification='bt709', value_range='limited'):
+def from_rgb(rgb, pixel_format, specification='bt709', value_range='limited', threads=1, out=None):
     """
-    Initialize a new yuv frame from rgb data.
+    Initialize a new yuv frame from rgb data. For subsampled pixel formats, the chroma is computed
+    directly at chroma resolution from the mean rgb of the covered pixels.
 
-    :param rgb: rgb data
+    :param rgb: rgb data of shape (height, width, 3) or (count, height, width, 3)
     :param pixel_format: ffmpeg pixel format specifier
     :param specification: specification identifier (default: 'bt709')
     :param value_range: yuv value range (default: 'limited')
-    :return: yuv frame
+    :param threads: number of threads converting tiles of rows in parallel (default: 1)
+    :param out: optional yuv frame or yuv batch of the pixel format the yuv data is written to (default: None)
+    :return: yuv frame, or yuv batch for rgb data of shape (count, height, width, 3)
     """
-    yuv_format = pixel_formats[pixel_format](rgb.shape[1], rgb.shape[0])
-    y, u, v = colorspaces[specification, value_range].from_rgb(rgb, yuv_format)
+    yuv_format = pixel_formats.get(pixel_format, rgb.shape[-2], rgb.shape[-3])
+    if out is not None:
+        if out.pixel_format != yuv_format.identifier():
+            raise ValueError(f"The output pixel format '{out.pixel_format}' does not match '{pixel_format}'.")
+        colorspaces[specification, value_range].from_rgb(rgb, yuv_format, threads=threads, out=out.split())
+        return out
+    y, u, v = colorspaces[specification, value_range].from_rgb(rgb, yuv_format, threads=threads)
+    if rgb.ndim == 4:
+        return YUVBatch(y, u, v, yuv_format)
     return YUVFrame(y, u, v, yuv_format)
+
+
+def iter_rgb(reader, specification='bt709', value_range='limited', upsampling='nearest', chroma_siting='left',
+             batch_size=1, threads=1, prefetch=0, layout='hwc'):
+    """
+    Iterate over the frames of a reader converted to rgb.
+
+    :param reader: yuv reader
+    :param specification: specification identifier (default: 'bt709')
+    :param value_range: yuv value range (default: 'limited')
+    :param upsampling: chroma upsampling 'nearest' or 'bilinear' (default: 'nearest')
+    :param chroma_siting: chroma sample position 'left', 'center' or 'topleft' (default: 'left')
+    :param batch_size: number of frames converted at once (default: 1)
+    :param threads: number of threads converting tiles of rows in parallel (default: 1)
+    :param prefetch: number of frames read ahead on a background thread if batch_size is 1 (default: 0)
+    :param layout: 'hwc' for interleaved or 'chw' for planar rgb data (default: 'hwc')
+    :return: iterator over rgb data of shape (height, width, 3) or (3, height, width), with a leading
+             count dimension if batch_size > 1
+    """
+    colorspace = colorspaces[specification, value_range]
+    yuv_items = reader.iter_batches(batch_size) if batch_size > 1 else reader.iter(prefetch=prefetch, reuse=True)
+    for yuv in yuv_items:
+        yield colorspace.to_rgb(*yuv.split(), yuv.yuv_format,
+                                upsampling=upsampling, chroma_siting=chroma_siting, threads=threads,
+                                layout=layout)
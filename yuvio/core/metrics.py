@@ -0,0 +1,125 @@
+from typing import Dict, Iterator, Sequence
+import numpy as np
+from .reader import Reader
+from .parallel import parallel_for
+
+
+_METRICS = ('mse', 'psnr', 'ssim')
+_PLANES = ('y', 'u', 'v')
+
+
+def _work_dtype(bitdepth):
+    """Integer dtype that holds squares and products of samples of the given bitdepth."""
+    return np.int32 if bitdepth <= 15 else np.int64
+
+
+def mse(reference: np.ndarray, distorted: np.ndarray, bitdepth: int) -> np.ndarray:
+    """Mean squared error over the last two axes."""
+    difference = np.subtract(reference, distorted, dtype=_work_dtype(bitdepth))
+    np.multiply(difference, difference, out=difference)
+    height, width = reference.shape[-2:]
+    return difference.sum(axis=(-2, -1), dtype=np.int64) / (height * width)
+
+
+def psnr(mse_values: np.ndarray, bitdepth: int) -> np.ndarray:
+    """Peak signal-to-noise ratio in dB from mean squared errors, inf for identical planes."""
+    max_value = (1 << bitdepth) - 1
+    with np.errstate(divide='ignore'):
+        return 10 * np.log10(max_value * max_value / np.asarray(mse_values, dtype=np.float64))
+
+
+def _block_sums(plane, height, width):
+    """Sums over non-overlapping 4x4 blocks."""
+    blocks = plane.reshape(plane.shape[:-2] + (height // 4, 4, width // 4, 4))
+    return blocks.sum(axis=(-3, -1), dtype=np.int64)
+
+
+def _window_sums(blocks):
+    """Sums over 8x8 windows of 2x2 neighboring blocks, i.e. windows overlapping by 4 samples."""
+    return blocks[..., :-1, :-1] + blocks[..., 1:, :-1] + blocks[..., :-1, 1:] + blocks[..., 1:, 1:]
+
+
+def ssim(reference: np.ndarray, distorted: np.ndarray, bitdepth: int) -> np.ndarray:
+    """Structural similarity over the last two axes, computed like ffmpeg's ssim filter on
+    8x8 windows with a step of 4 samples. Planes with fewer than 8 rows or columns contain
+    no window, their SSIM is nan."""
+    height, width = (reference.shape[-2] // 4) * 4, (reference.shape[-1] // 4) * 4
+    if height < 8 or width < 8:
+        return np.full(reference.shape[:-2], np.nan)
+    work_dtype = _work_dtype(bitdepth)
+    reference = reference[..., :height, :width].astype(work_dtype)
+    distorted = distorted[..., :height, :width].astype(work_dtype)
+
+    sum_reference = _window_sums(_block_sums(reference, height, width)).astype(np.float64)
+    sum_distorted = _window_sums(_block_sums(distorted, height, width)).astype(np.float64)
+    product = reference * distorted
+    sum_product = _window_sums(_block_sums(product, height, width)).astype(np.float64)
+    np.multiply(reference, reference, out=product)
+    sum_squares = _block_sums(product, height, width)
+    np.multiply(distorted, distorted, out=product)
+    sum_squares += _block_sums(product, height, width)
+    sum_squares = _window_sums(sum_squares).astype(np.float64)
+    del product, reference, distorted
+
+    max_value = (1 << bitdepth) - 1
+    c1 = 0.01 * 0.01 * max_value * max_value * 64
+    c2 = 0.03 * 0.03 * max_value * max_value * 64 * 63
+    if bitdepth == 8:
+        # ffmpeg's 8 bit path uses the constants rounded to integers.
+        c1, c2 = int(c1 + 0.5), int(c2 + 0.5)
+    variance = sum_squares * 64 - sum_reference * sum_reference - sum_distorted * sum_distorted
+    covariance = sum_product * 64 - sum_reference * sum_distorted
+    ssim_map = (2 * sum_reference * sum_distorted + c1) * (2 * covariance + c2) \
+        / ((sum_reference * sum_reference + sum_distorted * sum_distorted + c1) * (variance + c2))
+    return ssim_map.mean(axis=(-2, -1))
+
+
+def _validate(reference: Reader, distorted: Reader, metrics: Sequence[str]):
+    for metric in metrics:
+        if metric not in _METRICS:
+            raise ValueError(f"Unknown metric '{metric}', use any of {_METRICS}.")
+    reference_format, distorted_format = reference.format, distorted.format
+    if reference_format.resolution != distorted_format.resolution \
+            or reference_format.chroma_subsampling() != distorted_format.chroma_subsampling() \
+            or reference_format.bitdepth() != distorted_format.bitdepth():
+        raise ValueError("Cannot compare '{}' to '{}', the resolution, chroma subsampling and bitdepth "
+                         "of both formats must match.".format(reference_format.identifier(),
+                                                              distorted_format.identifier()))
+    if not reference.streaming and not distorted.streaming and len(reference) != len(distorted):
+        raise ValueError("Cannot compare '{}' frames to '{}' frames.".format(len(reference), len(distorted)))
+
+
+def compare_readers(reference: Reader, distorted: Reader, metrics: Sequence[str] = ('psnr', 'ssim'),
+                    batch_size: int = 8, threads: int = 1) -> Iterator[Dict[str, Dict[str, float]]]:
+    """Yield the metrics of every frame as {plane: {metric: value}} while reading both readers
+    in lockstep in batches of 'batch_size' frames. With threads > 1, the frames of a batch are
+    evaluated in parallel. Streams are compared up to the end of the shorter one."""
+    _validate(reference, distorted, metrics)
+    bitdepth = reference.format.bitdepth()
+    planes = _PLANES[:1] if reference.format.chroma_subsampling() == (0, 0) else _PLANES
+
+    for reference_batch, distorted_batch in zip(reference.iter_batches(batch_size),
+                                                distorted.iter_batches(batch_size)):
+        count = min(len(reference_batch), len(distorted_batch))
+        results = {(plane, metric): np.empty(count) for plane in planes for metric in metrics}
+
+        def evaluate(start, stop):
+            # Frame by frame, which bounds the temporaries to one frame per thread.
+            for i in range(start, stop):
+                for plane in planes:
+                    reference_plane = getattr(reference_batch, plane)[i]
+                    distorted_plane = getattr(distorted_batch, plane)[i]
+                    if 'mse' in metrics or 'psnr' in metrics:
+                        mse_value = mse(reference_plane, distorted_plane, bitdepth)
+                        if 'mse' in metrics:
+                            results[plane, 'mse'][i] = mse_value
+                        if 'psnr' in metrics:
+                            results[plane, 'psnr'][i] = psnr(mse_value, bitdepth)
+                    if 'ssim' in metrics:
+                        results[plane, 'ssim'][i] = ssim(reference_plane, distorted_plane, bitdepth)
+
+        parallel_for(evaluate, count, threads)
+        for i in range(count):
+            yield {plane: {metric: float(results[plane, metric][i]) for metric in metrics} for plane in planes}
+        if count < max(len(reference_batch), len(distorted_batch)):
+            return
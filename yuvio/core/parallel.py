@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def executor(threads: int) -> ThreadPoolExecutor:
+    """Return the shared thread pool with the given number of threads."""
+    with _executors_lock:
+        if threads not in _executors:
+            _executors[threads] = ThreadPoolExecutor(max_workers=threads)
+        return _executors[threads]
+
+
+def parallel_for(func, count: int, threads: int):
+    """Call func(start, stop) for up to 'threads' contiguous bands covering range(count)."""
+    bands = max(1, min(threads, count))
+    if bands == 1:
+        func(0, count)
+        return
+    bounds = [count * i // bands for i in range(bands + 1)]
+    futures = [executor(threads).submit(func, start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+    for future in futures:
+        future.result()
@@ -0,0 +1,27 @@
+from typing import Optional
+import threading
+import numpy as np
+
+
+class BufferPool:
+    """Pool of frame buffers that recycles released buffers instead of allocating new ones."""
+
+    def __init__(self, dtype: np.dtype, count: int = 1, capacity: Optional[int] = None):
+        self._dtype = dtype
+        self._count = count
+        self._capacity = capacity
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> np.ndarray:
+        """Return a released buffer or a newly allocated one if none is available."""
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return np.empty(self._count, dtype=self._dtype)
+
+    def release(self, buffer: np.ndarray):
+        """Return the buffer to the pool, views into it must no longer be used."""
+        with self._lock:
+            if self._capacity is None or len(self._free) < self._capacity:
+                self._free.append(buffer)
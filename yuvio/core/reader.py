@@ -1,15 +1,46 @@
-from typing import Union
+from typing import Union, Optional
+from collections.abc import Sequence
 import io
+import os
+import queue
+import threading
 from pathlib import Path
 import psutil
 import numpy as np
-from . import YUVFrame
+from . import YUVFrame, YUVBatch
 from . import Format
+from .format import to_native_byteorder
+from .pool import BufferPool
+
+
+_END = object()
+
+# Number of bytes read at once when reading a stream of unknown length to its end.
+_STREAM_CHUNK_SIZE = 64 * 1024 * 1024
 
 
 class Reader:
+    """Reader for yuv files and streams.
+
+    Non-seekable streams (pipes, stdin, sockets) are read forward only: their
+    length is unknown, frames before the current position cannot be read and
+    reading stops at the end of the stream.
 
-    def __init__(self, file: Union[Path, str, io.RawIOBase, io.BufferedIOBase], format: Format):
+    If max_bytes is given, reads of more than max_bytes return a lazy FrameSequence
+    that reads its frames in chunks of at most max_bytes on access. Without max_bytes,
+    reads of several frames that need more than 90% of the available system memory
+    raise a RuntimeError, set max_bytes to read such ranges lazily. With threads > 1,
+    formats that do actual work while unpacking split it into row bands across a
+    thread pool.
+
+    If native_endian is True, frames of formats with non-native byte order (e.g. the
+    big-endian formats on little-endian machines) are byteswapped once after reading
+    and unpacked to components in native byte order. The swap is done in place in the
+    read buffer, memory mapped data is swapped into a copy."""
+
+    def __init__(self, file: Union[Path, str, io.RawIOBase, io.BufferedIOBase], format: Format,
+                 mmap: bool = False, max_bytes: Optional[int] = None, threads: int = 1,
+                 native_endian: bool = False):
         if isinstance(file, io.RawIOBase) or isinstance(file, io.BufferedIOBase):
             self._close = False
             self._file = file
@@ -17,7 +48,16 @@ class Reader:
             self._close = True
             self._file = open(Path(file).expanduser().resolve(), 'rb')
         self._format = format
-        self._length = self._length_from_stream()
+        self._streaming = not self._file.seekable()
+        if self._streaming and mmap:
+            raise ValueError("Cannot memory map the non-seekable stream '{}'.".format(self.name))
+        self._length = None if self._streaming else self._length_from_stream()
+        self._position = 0
+        self._mmap = self._map_stream() if mmap else None
+        self._max_bytes = max_bytes
+        self._threads = threads
+        self._native_endian = native_endian
+        self._lock = threading.Lock()
         self._iter_idx = 0
 
     def __del__(self):
@@ -25,53 +65,395 @@ class Reader:
             self._file.close()
 
     def __len__(self):
+        if self._streaming:
+            raise TypeError("The length of the non-seekable stream '{}' is unknown.".format(self.name))
         return self._length
 
     def __iter__(self):
+        if self._streaming:
+            while True:
+                yuv_frames = self.read(self._position, count=1)
+                if not yuv_frames:
+                    return
+                yield yuv_frames[0]
         for i in range(self._length):
             yield self.read(i, count=1)[0]
 
+    @property
+    def name(self):
+        return getattr(self._file, 'name', self._file)
+
+    @property
+    def format(self) -> Format:
+        return self._format
+
+    @property
+    def streaming(self):
+        return self._streaming
+
+    def iter(self, prefetch=0, reuse=False):
+        """Iterate over all frames. If prefetch > 0, a background thread reads and
+        unpacks up to 'prefetch' frames ahead of the consumer. If reuse is True, frames
+        are read into recycled buffers and each frame is only valid until the next one
+        is requested."""
+        if prefetch <= 0:
+            return self._iter_reuse() if reuse else iter(self)
+        return self._iter_prefetch(prefetch, reuse)
+
+    def _iter_buffers(self, pool):
+        """Yield (frame, buffer) with every frame read into a buffer acquired from the pool."""
+        index = self._position if self._streaming else 0
+        while self._streaming or index < self._length:
+            buffer = pool.acquire()
+            yuv_frames = self.read_into(index, buffer)
+            if not yuv_frames:
+                pool.release(buffer)
+                return
+            yield yuv_frames[0], buffer
+            index += 1
+
+    def _iter_reuse(self):
+        pool = BufferPool(self._format.layout.dtype, capacity=1)
+        for yuv_frame, buffer in self._iter_buffers(pool):
+            yield yuv_frame
+            pool.release(buffer)
+
+    def _iter_prefetch(self, prefetch, reuse=False):
+        frames = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+        pool = BufferPool(self._format.layout.dtype, capacity=prefetch + 2) if reuse else None
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    frames.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                items = self._iter_buffers(pool) if reuse else ((yuv_frame, None) for yuv_frame in self)
+                for item in items:
+                    if not put(item):
+                        return
+            except BaseException as e:
+                put(e)
+                return
+            put(_END)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            buffer = None
+            while True:
+                if buffer is not None:
+                    pool.release(buffer)
+                item = frames.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yuv_frame, buffer = item
+                yield yuv_frame
+        finally:
+            stop.set()
+            producer.join()
+
+    def iter_batches(self, batch_size):
+        """Iterate over all frames in batches of up to 'batch_size' frames. With max_bytes
+        set, batches are limited to the number of frames that fit into max_bytes."""
+        if self._max_bytes is not None:
+            batch_size = min(batch_size, max(1, self._max_bytes // self._format.layout.itemsize))
+        if self._streaming:
+            while True:
+                yuv_batch = self.read(self._position, batch_size, as_batch=True)
+                if len(yuv_batch) == 0:
+                    return
+                yield yuv_batch
+        for index in range(0, self._length, batch_size):
+            yield self.read(index, min(batch_size, self._length - index), as_batch=True)
+
     def _length_from_stream(self):
         stream_pos = self._file.tell()
         self._file.seek(0, io.SEEK_END)
         num_bytes = self._file.tell()
         self._file.seek(stream_pos, io.SEEK_SET)
-        return num_bytes // self._format.dtype.itemsize
+        return num_bytes // self._format.layout.itemsize
+
+    def _map_stream(self):
+        if self._length == 0:
+            return np.empty(0, dtype=self._format.layout.dtype)
+        try:
+            self._file.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            raise ValueError("Cannot memory map '{}', the stream is not backed "
+                             "by a file descriptor.".format(self.name))
+        # The memmap is kept alive as the base of the returned view. Frames
+        # unpacked from it are read-only views into the mapping.
+        data = np.memmap(self._file, dtype=self._format.layout.dtype, mode='r', shape=(self._length,))
+        return data.view(np.ndarray)
 
     def _validate_memory(self, count):
         available = psutil.virtual_memory().available
-        required = count * self._format.dtype.itemsize
+        required = count * self._format.layout.itemsize
         if required > available * 0.9:
             raise RuntimeError("The required memory ({}) to read '{}' frames "
                                "from file '{}' exceeds 90% of the available system "
-                               "memory ({})".format(required,
+                               "memory ({}), set max_bytes to read them lazily".format(required,
                                                     count,
-                                                    self._file.name,
+                                                    self.name,
                                                     available))
 
-    def read(self, index, count=None):
+    def _readinto(self, buffer):
+        """Fill the buffer from the stream, retrying short reads. Returns the number of bytes read."""
+        view = memoryview(buffer).cast('B')
+        total = 0
+        while total < len(view):
+            num_bytes = self._file.readinto(view[total:])
+            if not num_bytes:
+                break
+            total += num_bytes
+        return total
+
+    def _read_stream_into(self, index, out):
+        """Read frames at index into out, returns the number of frames read."""
+        if index < self._position:
+            raise ValueError("Cannot read frame '{}' from the non-seekable stream '{}' "
+                             "at frame '{}'.".format(index, self.name, self._position))
+        if index > self._position:
+            skipped = np.empty(1, dtype=self._format.layout.dtype)
+            while self._position < index:
+                if self._read_stream_frames(skipped) < 1:
+                    return 0
+                self._position += 1
+        read_count = self._read_stream_frames(out)
+        self._position += read_count
+        return read_count
+
+    def _read_stream_frames(self, out):
+        """Read the next frames of a stream into out, returns the number of complete frames read."""
+        return self._readinto(out.data) // self._format.layout.itemsize
+
+    def _read_frames_into(self, index, out):
+        """Read len(out) frames starting at index from a seekable file into out."""
+        self._file.seek(self._frame_offset(index))
+        self._readinto(out.data)
+
+    def _read_stream(self, index, count):
+        if count is None:
+            chunks = []
+            chunk_count = max(1, _STREAM_CHUNK_SIZE // self._format.layout.itemsize)
+            while True:
+                chunk = self._read_stream(index, chunk_count)
+                chunks.append(chunk)
+                index = self._position
+                if len(chunk) < chunk_count:
+                    return np.concatenate(chunks)
+
+        data = np.empty(count, dtype=self._format.layout.dtype)
+        return data[:self._read_stream_into(index, data)]
+
+    def _validate_range(self, index, count):
         if count is None:
             count = self._length - index
         if index + count > self._length:
             raise ValueError("Cannot read number of frames '{}' at index '{}' "
                              "from file '{}' with length '{}'.".format(count,
                                                                        index,
-                                                                       self._file.name,
+                                                                       self.name,
                                                                        self._length))
-        self._validate_memory(count)
-        self._file.seek(index * self._format.dtype.itemsize)
-        data = np.empty(count, dtype=self._format.dtype)
-        self._file.readinto(data.data)
-        return self.unpack_data(data)
+        return count
 
-    def unpack_data(self, data):
-        y_frames, u_frames, v_frames = self._format.unpack(data)
+    def read_data_into(self, index, out):
+        """Read len(out) frames starting at index into the preallocated frames out, an
+        array of the format's frame dtype, without unpacking them. Returns the part of
+        out that was read, non-seekable streams may read fewer frames at their end."""
+        if out.dtype != self._format.layout.dtype or out.ndim != 1:
+            raise ValueError("The output frames must be a one dimensional array of dtype '{}'."
+                             .format(self._format.layout.dtype))
+        if self._streaming:
+            with self._lock:
+                return out[:self._read_stream_into(index, out)]
+
+        count = self._validate_range(index, len(out))
+        if self._mmap is not None:
+            np.copyto(out, self._mmap[index:index + count])
+        else:
+            with self._lock:
+                self._read_frames_into(index, out)
+        return out
+
+    def read_into(self, index, out, as_batch=False):
+        """Read len(out) frames starting at index into the preallocated frames out, an
+        array of the format's frame dtype. For planar formats the returned components
+        are views into out, which is byteswapped in place if native_endian is set.
+        Non-seekable streams may read fewer frames at their end."""
+        return self.unpack_data(self.read_data_into(index, out), as_batch)
+
+    def read_data(self, index, count=None):
+        """Read the frames starting at index without unpacking them. The frames are read at once,
+        which raises a RuntimeError if they need more than 90% of the available system memory."""
+        if self._streaming:
+            with self._lock:
+                return self._read_stream(index, count)
+
+        count = self._validate_range(index, count)
+        if self._mmap is not None:
+            return self._mmap[index:index + count]
+        if self._max_bytes is None and count > 1:
+            self._validate_memory(count)
+        return self.read_data_into(index, np.empty(count, dtype=self._format.layout.dtype))
+
+    def read(self, index, count=None, as_batch=False):
+        if not self._streaming and self._mmap is None and self._max_bytes is not None:
+            count = self._validate_range(index, count)
+            if count > 1 and count * self._format.layout.itemsize > self._max_bytes:
+                if as_batch:
+                    raise ValueError("Cannot read '{}' frames as one batch within the memory budget of '{}' "
+                                     "bytes, read at most '{}' frames per batch.".format(
+                                         count, self._max_bytes,
+                                         max(1, self._max_bytes // self._format.layout.itemsize)))
+                return FrameSequence(self, index, count)
+        return self.unpack_data(self.read_data(index, count), as_batch)
+
+    def unpack_data(self, data, as_batch=False):
+        return self._unpack(data, self._format, as_batch)
+
+    def _unpack(self, data, yuv_format, as_batch=False):
+        if self._native_endian:
+            data = to_native_byteorder(data)
+        if self._threads > 1:
+            y_frames, u_frames, v_frames = yuv_format.unpack_threaded(data, self._threads)
+        else:
+            y_frames, u_frames, v_frames = yuv_format.unpack(data)
+        if as_batch:
+            if yuv_format.chroma_subsampling() == (0, 0):
+                return YUVBatch(y_frames, None, None, yuv_format)
+            return YUVBatch(y_frames, u_frames, v_frames, yuv_format)
 
         yuv_frames = []
-        if self._format.chroma_subsampling() != (0, 0):
+        if yuv_format.chroma_subsampling() != (0, 0):
             for y_frame, u_frame, v_frame in zip(y_frames, u_frames, v_frames):
-                yuv_frames.append(YUVFrame(y_frame, u_frame, v_frame, self._format))
+                yuv_frames.append(YUVFrame(y_frame, u_frame, v_frame, yuv_format))
         else:
             for y_frame in y_frames:
-                yuv_frames.append(YUVFrame(y_frame, None, None, self._format))
+                yuv_frames.append(YUVFrame(y_frame, None, None, yuv_format))
         return yuv_frames
+
+    def read_region(self, index, x, y, width, height, count=1, as_batch=False):
+        """Read the region of width x height samples at (x, y) of count frames starting at index.
+
+        Only the rows of the region are read from seekable files, each with a positioned read,
+        so a small region reads only a fraction of the frame. Memory mapped and streamed frames
+        are cropped instead. Supported are formats that store each component in its own plane
+        or in an interleaved chroma plane, e.g. the planar formats and nv12. The region must be
+        aligned to the chroma subsampling, the returned frames have the region's resolution."""
+        frame_width, frame_height = self._format.resolution
+        sub_w, sub_h = (max(sub, 1) for sub in self._format.chroma_subsampling())
+        if x < 0 or y < 0 or width <= 0 or height <= 0 or x + width > frame_width or y + height > frame_height:
+            raise ValueError("The region ({}, {}, {}, {}) exceeds the frame size ({}, {})."
+                             .format(x, y, width, height, frame_width, frame_height))
+        if x % sub_w or y % sub_h or width % sub_w or height % sub_h:
+            raise ValueError("The region ({}, {}, {}, {}) is not aligned to the chroma subsampling ({}, {}) "
+                             "of '{}'.".format(x, y, width, height, sub_w, sub_h, self._format.identifier()))
+        region_format = type(self._format)(width, height)
+        fields = self._region_fields(x, y)
+
+        if self._streaming or self._mmap is not None:
+            data = self.read_data(index, count)
+            region = np.empty(len(data), dtype=region_format.layout.dtype)
+            for plane, row, column in fields:
+                rows, columns = region_format.layout[plane.name].shape
+                region[plane.name] = data[plane.name][:, row:row + rows, column:column + columns]
+        else:
+            count = self._validate_range(index, count)
+            region = np.empty(count, dtype=region_format.layout.dtype)
+            self._read_region_into(index, region, fields)
+        return self._unpack(region, region_format, as_batch)
+
+    def _region_fields(self, x, y):
+        """(plane layout, first row, first column) of the region (x, y) in every plane of the frame."""
+        frame_width, frame_height = self._format.resolution
+        fields = []
+        for plane in self._format.layout.planes:
+            if plane.dtype.itemsize == 0:
+                continue
+            if len(plane.shape) != 2 or frame_height % plane.shape[0] or frame_width % plane.shape[1]:
+                raise ValueError("Cannot read regions of '{}', its components are not stored in planes."
+                                 .format(self._format.identifier()))
+            row_scale, column_scale = frame_height // plane.shape[0], frame_width // plane.shape[1]
+            fields.append((plane, y // row_scale, x // column_scale))
+        return fields
+
+    def _read_region_into(self, index, region, fields):
+        try:
+            fd = self._file.fileno() if hasattr(os, 'preadv') else None
+        except (AttributeError, io.UnsupportedOperation):
+            fd = None
+        for i in range(len(region)):
+            frame_offset = self._frame_offset(index + i)
+            for plane, row, column in fields:
+                target = region[plane.name][i]
+                offset = frame_offset + plane.offset + row * plane.strides[0] + column * plane.strides[1]
+                if target.shape[1] == plane.shape[1]:
+                    # Complete rows are contiguous in the file.
+                    self._pread_into(fd, target, offset)
+                    continue
+                for target_row in target:
+                    self._pread_into(fd, target_row, offset)
+                    offset += plane.strides[0]
+
+    def _pread_into(self, fd, buffer, offset):
+        """Fill the buffer from the given file offset without moving the position of the file."""
+        view = memoryview(buffer).cast('B')
+        if fd is None:
+            with self._lock:
+                stream_pos = self._file.tell()
+                self._file.seek(offset, io.SEEK_SET)
+                num_bytes = self._readinto(view)
+                self._file.seek(stream_pos, io.SEEK_SET)
+        else:
+            num_bytes = 0
+            while num_bytes < len(view):
+                read = os.preadv(fd, [view[num_bytes:]], offset + num_bytes)
+                if not read:
+                    break
+                num_bytes += read
+        if num_bytes < len(view):
+            raise ValueError("Unexpected end of file '{}' at offset '{}'.".format(self.name, offset + num_bytes))
+
+    def _frame_offset(self, index):
+        """Byte offset of the frame data of the frame at index."""
+        return index * self._format.layout.itemsize
+
+
+class FrameSequence(Sequence):
+    """Lazy sequence of frames that reads chunks of frames from a reader on access."""
+
+    def __init__(self, reader: Reader, index: int, count: int):
+        self._reader = reader
+        self._index = index
+        self._count = count
+        self._chunk_count = max(1, reader._max_bytes // reader._format.layout.itemsize)
+        self._chunk_index = None
+        self._chunk = None
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(self._count))]
+        if key < 0:
+            key += self._count
+        if not 0 <= key < self._count:
+            raise IndexError("Frame index '{}' out of range for '{}' frames.".format(key, self._count))
+        chunk_index = key // self._chunk_count
+        if chunk_index != self._chunk_index:
+            start = chunk_index * self._chunk_count
+            count = min(self._chunk_count, self._count - start)
+            self._chunk = self._reader.read(self._index + start, count)
+            self._chunk_index = chunk_index
+        return self._chunk[key % self._chunk_count]
@@ -0,0 +1,102 @@
+from typing import Dict, Iterator, Optional
+import numpy as np
+from .reader import Reader
+from .parallel import parallel_for
+
+
+# Number of bytes read at once.
+_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Maximum size of the bin indices of one bincount call.
+_BINCOUNT_BYTES = 16 * 1024 * 1024
+
+# Maximum size of the histograms of one batch.
+_HISTOGRAM_BYTES = 16 * 1024 * 1024
+
+_PLANES = ('y', 'u', 'v')
+
+
+def histograms(planes: np.ndarray, bins: int) -> np.ndarray:
+    """Histograms of the planes of shape (count, height, width) as (count, bins + 1), computed by
+    a single bincount with the bins of each plane offset by its index. Samples >= bins are counted
+    in the last bin."""
+    count = len(planes)
+    offsets = (np.arange(count, dtype=np.intp) * (bins + 1)).reshape((count,) + (1,) * (planes.ndim - 1))
+    indices = planes.astype(np.intp)
+    np.minimum(indices, bins, out=indices)
+    indices += offsets
+    return np.bincount(indices.ravel(), minlength=count * (bins + 1)).reshape(count, bins + 1)
+
+
+def histogram_stats(histogram: np.ndarray) -> Dict[str, float]:
+    """Minimum, maximum, mean and variance of the samples counted by a histogram."""
+    occupied = np.flatnonzero(histogram)
+    if len(occupied) == 0:
+        return {'min': None, 'max': None, 'mean': None, 'variance': None}
+    values = occupied.astype(np.int64)
+    counts = histogram[occupied].astype(np.int64)
+    return _moments(int(occupied[0]), int(occupied[-1]), int(counts.sum()),
+                    int(counts @ values), int(counts @ (values * values)))
+
+
+def sample_stats(plane: np.ndarray) -> Dict[str, float]:
+    """Minimum, maximum, mean and variance of the samples of a plane."""
+    if plane.size == 0:
+        return {'min': None, 'max': None, 'mean': None, 'variance': None}
+    values = plane.astype(np.int64)
+    return _moments(int(values.min()), int(values.max()), values.size,
+                    int(values.sum()), int(np.multiply(values, values, out=values).sum()))
+
+
+def _moments(min_value, max_value, count, sum_values, sum_squares):
+    # Exact integer sums, the variance is computed from them without cancellation.
+    return {'min': min_value,
+            'max': max_value,
+            'mean': sum_values / count,
+            'variance': (sum_squares * count - sum_values * sum_values) / (count * count)}
+
+
+def frame_stats(reader: Reader, histogram: bool = True, threads: int = 1,
+                batch_size: Optional[int] = None) -> Iterator[Dict[str, Dict]]:
+    """Yield the statistics of every frame as {plane: {'min', 'max', 'mean', 'variance'[, 'histogram']}}.
+
+    Frames are read in batches of batch_size frames, by default as many as fit into 64 MiB,
+    and their histograms computed by vectorized bincounts over several frames at once. Batches
+    are limited further so that their histograms fit into 16 MiB. With threads > 1, the frames
+    of a batch are split into bands across a thread pool. Histograms have 2 ** bitdepth bins and
+    all statistics are derived from them, except for frames with samples beyond the bitdepth,
+    whose statistics are computed from the samples."""
+    yuv_format = reader.format
+    planes = _PLANES[:1] if yuv_format.chroma_subsampling() == (0, 0) else _PLANES
+    bins = 1 << yuv_format.bitdepth()
+    histogram_size = len(planes) * (bins + 1) * np.dtype(np.intp).itemsize
+    if batch_size is None:
+        batch_size = max(1, _CHUNK_SIZE // yuv_format.layout.itemsize)
+    batch_size = max(1, min(batch_size, _HISTOGRAM_BYTES // histogram_size))
+
+    for yuv_batch in reader.iter_batches(batch_size):
+        count = len(yuv_batch)
+        results = {}
+        for plane in planes:
+            samples = getattr(yuv_batch, plane)
+            frames_per_call = max(1, _BINCOUNT_BYTES // (samples[0].size * np.dtype(np.intp).itemsize))
+            counts = np.empty((count, bins + 1), dtype=np.intp)
+
+            def count_band(start, stop):
+                for i in range(start, stop, frames_per_call):
+                    end = min(i + frames_per_call, stop)
+                    counts[i:end] = histograms(samples[i:end], bins)
+
+            parallel_for(count_band, count, threads)
+            results[plane] = counts
+
+        for i in range(count):
+            frame = {}
+            for plane in planes:
+                counts = results[plane][i]
+                # Samples beyond the bitdepth only land in the last bin, so their values are lost.
+                frame[plane] = histogram_stats(counts) if counts[bins] == 0 \
+                    else sample_stats(getattr(yuv_batch, plane)[i])
+                if histogram:
+                    frame[plane]['histogram'] = counts[:bins].copy()
+            yield frame
@@ -0,0 +1,93 @@
+from concurrent.futures import ProcessPoolExecutor
+import io
+from pathlib import Path
+from .. import pixel_formats
+from . import Format
+from . import Reader, Writer
+from . import converters
+from .bitdepth import bitdepth_converter, _MODES
+
+
+# Number of source bytes converted at once.
+_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def _chunk_count(src_format: Format):
+    return max(1, _CHUNK_SIZE // src_format.layout.itemsize)
+
+
+def _validate(src_format: Format, dst_format: Format, mode: str):
+    if mode not in _MODES:
+        raise ValueError(f"Unknown bitdepth conversion mode '{mode}', use one of {_MODES}.")
+    if src_format.chroma_subsampling() != dst_format.chroma_subsampling():
+        raise ValueError("Cannot convert '{}' to '{}', the chroma subsampling "
+                         "of both formats must match.".format(src_format.identifier(), dst_format.identifier()))
+
+
+def _converter(src_format: Format, dst_format: Format, mode: str):
+    if src_format.bitdepth() != dst_format.bitdepth():
+        return bitdepth_converter(mode)
+    return converters.get(src_format, dst_format)
+
+
+def _transcode_stream(src, dst, src_format: Format, dst_format: Format, mode: str):
+    reader = Reader(src, src_format)
+    writer = Writer(dst, dst_format)
+    converter = _converter(src_format, dst_format, mode)
+    chunk_count = _chunk_count(src_format)
+    count = 0
+    while reader.streaming or count < len(reader):
+        data = reader.read_data(count, chunk_count if reader.streaming else min(chunk_count, len(reader) - count))
+        if len(data) == 0:
+            break
+        writer.write_data(converter(data, src_format, dst_format))
+        count += len(data)
+    writer.flush()
+    return count
+
+
+def _transcode_range(src, dst, width, height, src_pix_fmt, dst_pix_fmt, mode, start, stop):
+    """Convert the frames [start, stop) and write them at their offset into the preallocated dst."""
+    src_format = pixel_formats.get(src_pix_fmt, width, height)
+    dst_format = pixel_formats.get(dst_pix_fmt, width, height)
+    reader = Reader(src, src_format)
+    converter = _converter(src_format, dst_format, mode)
+    chunk_count = _chunk_count(src_format)
+    with open(dst, 'r+b') as dst_file:
+        writer = Writer(dst_file, dst_format)
+        dst_file.seek(start * dst_format.layout.itemsize)
+        for index in range(start, stop, chunk_count):
+            data = reader.read_data(index, min(chunk_count, stop - index))
+            writer.write_data(converter(data, src_format, dst_format))
+        writer.flush()
+
+
+def transcode(src, dst, src_format: Format, dst_format: Format, workers: int = 1, mode: str = 'round') -> int:
+    """Convert all frames from src to dst in bounded chunks and return the number of frames.
+
+    Formats with different bitdepths are converted according to mode, see convert_bitdepth.
+
+    With workers > 1, src and dst must be paths. The frame range is then split across worker
+    processes that write their frames at the correct offset into the preallocated dst. Worker
+    processes only know the formats registered on import of yuvio."""
+    _validate(src_format, dst_format, mode)
+    if workers <= 1:
+        return _transcode_stream(src, dst, src_format, dst_format, mode)
+    if isinstance(src, io.IOBase) or isinstance(dst, io.IOBase):
+        raise ValueError("Converting with multiple workers requires file paths for source and destination.")
+
+    src = Path(src).expanduser().resolve()
+    dst = Path(dst).expanduser().resolve()
+    count = len(Reader(src, src_format))
+    with open(dst, 'wb') as dst_file:
+        dst_file.truncate(count * dst_format.layout.itemsize)
+
+    bounds = [count * i // workers for i in range(workers + 1)]
+    width, height = src_format.resolution
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_transcode_range, src, dst, width, height,
+                               src_format.identifier(), dst_format.identifier(), mode, start, stop)
+                   for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        for future in futures:
+            future.result()
+    return count
@@ -1,14 +1,26 @@
 from typing import Union, List
+import io
+import os
+import queue
+import threading
 from io import IOBase
 from pathlib import Path
 import numpy as np
-from . import YUVFrame
+from . import YUVFrame, YUVBatch
 from . import Format
 
 
+# Conservative limit for the number of buffers per writev call (POSIX IOV_MAX is at least 16, Linux uses 1024).
+_IOV_MAX = 1024
+
+_END = object()
+
+
 class Writer:
+    """Writer for yuv files and streams. With threads > 1, formats that do actual work
+    while packing split it into row bands across a thread pool."""
 
-    def __init__(self, file, format: Format):
+    def __init__(self, file, format: Format, threads: int = 1):
         if isinstance(file, IOBase):
             self._close = False
             self._file = file
@@ -16,17 +28,34 @@ class Writer:
             self._close = True
             self._file = open(Path(file).expanduser().resolve(), 'wb')
         self._format = format
+        self._threads = threads
 
     def __del__(self):
+        if getattr(self, '_close', False) and hasattr(self, '_file'):
+            self._file.close()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
         if self._close:
             self._file.close()
+            self._close = False
+        else:
+            self._file.flush()
 
-    def write(self, yuv_frames: Union[List[YUVFrame], YUVFrame]):
+    def write(self, yuv_frames: Union[List[YUVFrame], YUVFrame, YUVBatch]):
+        if isinstance(yuv_frames, YUVBatch):
+            if len(yuv_frames) > 0 and not self._write_planes(yuv_frames):
+                self._write_frames(self._pack(yuv_frames.split()))
+            return
         if isinstance(yuv_frames, YUVFrame):
             yuv_frames = [yuv_frames]
         frame_count = len(yuv_frames)
         if frame_count == 0:
             return
+        if self._write_planes(yuv_frames):
+            return
 
         if self._format.chroma_subsampling() != (0, 0):
             y = np.empty((frame_count, yuv_frames[0].y.shape[0], yuv_frames[0].y.shape[1]),
@@ -39,12 +68,142 @@ class Writer:
                 y[i] = yuv_frame[0]
                 u[i] = yuv_frame[1]
                 v[i] = yuv_frame[2]
-            data = self._format.pack((y, u, v))
+            data = self._pack((y, u, v))
         else:
             y = np.empty((frame_count, yuv_frames[0].y.shape[0], yuv_frames[0].y.shape[1]),
                          dtype=yuv_frames[0].y.dtype)
             for i, yuv_frame in enumerate(yuv_frames):
                 y[i] = yuv_frame[0]
-            data = self._format.pack((y, None, None))
+            data = self._pack((y, None, None))
+
+        self._write_frames(data)
+
+    def write_data(self, data: np.ndarray):
+        """Write frames that are already packed in the format's frame dtype."""
+        if data.dtype != self._format.layout.dtype:
+            raise ValueError("Cannot write data of dtype '{}' as '{}'.".format(data.dtype,
+                                                                              self._format.identifier()))
+        self._write_frames(np.ascontiguousarray(data))
+
+    def _write_frames(self, data: np.ndarray):
+        """Write contiguous packed frames."""
+        self._write(data.data)
+
+    def _frame_buffers(self, planes: List[np.ndarray]) -> List:
+        """Buffers to write for one frame given the planes of the frame in storage order."""
+        return planes
+
+    def _pack(self, yuv):
+        if self._threads > 1:
+            return self._format.pack_threaded(yuv, self._threads)
+        return self._format.pack(yuv)
+
+    def _write(self, buffer):
+        """Write the whole buffer, retrying short writes of raw streams such as pipes."""
+        view = memoryview(buffer).cast('B')
+        while len(view) > 0:
+            written = self._file.write(view)
+            view = view[written or 0:]
+
+    def _write_planes(self, yuv_frames):
+        """Write the frames without packing if the format stores their components as they are."""
+        buffers = []
+        for yuv_frame in yuv_frames:
+            planes = self._format.planes(yuv_frame.split())
+            if planes is None:
+                return False
+            buffers.extend(self._frame_buffers(planes))
+        self._write_buffers(buffers)
+        return True
+
+    def _write_buffers(self, buffers):
+        views = [memoryview(buffer).cast('B') for buffer in buffers]
+        try:
+            fd = self._file.fileno() if hasattr(os, 'writev') else None
+        except (AttributeError, io.UnsupportedOperation):
+            fd = None
+        if fd is None:
+            for view in views:
+                self._write(view)
+            return
+
+        self._file.flush()
+        start = 0
+        while start < len(views):
+            written = os.writev(fd, views[start:start + _IOV_MAX])
+            while start < len(views) and written >= len(views[start]):
+                written -= len(views[start])
+                start += 1
+            if written > 0:
+                views[start] = views[start][written:]
+        if self._file.seekable():
+            # Resynchronize the position cached by buffered streams with the descriptor.
+            self._file.seek(0, io.SEEK_CUR)
+
+
+class AsyncWriter:
+    """Writer that packs and writes frames on a background thread.
+
+    Frames are queued and must not be modified after passing them to write. If
+    the queue holds 'queue_depth' pending writes, write blocks until the worker
+    catches up. The first error of the worker stops all further writes to the file and
+    is raised by this and every later call to write, flush or close."""
+
+    def __init__(self, file, format: Format, queue_depth: int = 8, threads: int = 1):
+        self._closed = True
+        self._writer = Writer(file, format, threads=threads)
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._errors = []
+        self._worker = threading.Thread(target=_write_queued,
+                                        args=(self._writer, self._queue, self._errors),
+                                        daemon=True)
+        self._worker.start()
+        self._closed = False
+
+    def __del__(self):
+        if getattr(self, '_closed', True):
+            return
+        try:
+            self.close()
+        except Exception:
+            # Errors cannot be raised from a finalizer, close explicitly to see them.
+            pass
+
+    def _raise_error(self):
+        if self._errors:
+            raise self._errors[0]
+
+    def write(self, yuv_frames: Union[List[YUVFrame], YUVFrame, YUVBatch]):
+        self._raise_error()
+        if self._closed:
+            raise ValueError("Cannot write to a closed writer.")
+        self._queue.put(yuv_frames)
+
+    def flush(self):
+        if not self._closed:
+            self._queue.join()
+        self._raise_error()
+        self._writer.flush()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_END)
+            self._worker.join()
+            self._writer.close()
+        self._raise_error()
+
 
-        self._file.write(data.data)
+def _write_queued(writer, frames, errors):
+    while True:
+        yuv_frames = frames.get()
+        try:
+            if yuv_frames is _END:
+                return
+            # Drop everything after the first error, it is raised on the producer side.
+            if not errors:
+                writer.write(yuv_frames)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            frames.task_done()
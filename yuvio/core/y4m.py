@@ -0,0 +1,240 @@
+from typing import Union, Optional, Tuple, NamedTuple, List
+import io
+import os
+from pathlib import Path
+import numpy as np
+from .. import pixel_formats
+from . import Format
+from .reader import Reader
+from .writer import Writer
+
+
+_SIGNATURE = b'YUV4MPEG2'
+_FRAME_MARKER = b'FRAME'
+
+# Y4M colorspace tags (C parameter) and their pixel formats. Samples of more than 8 bits are little-endian.
+_PIXEL_FORMATS = {
+    'mono': 'gray',
+    'mono9': 'gray9le',
+    'mono10': 'gray10le',
+    'mono12': 'gray12le',
+    'mono14': 'gray14le',
+    'mono16': 'gray16le',
+    '420jpeg': 'yuv420p',
+    '420mpeg2': 'yuv420p',
+    '420paldv': 'yuv420p',
+    '420': 'yuv420p',
+    '422': 'yuv422p',
+    '444': 'yuv444p',
+}
+for _subsampling in ('420', '422', '444'):
+    for _bitdepth in (9, 10, 12, 14, 16):
+        _PIXEL_FORMATS[f'{_subsampling}p{_bitdepth}'] = f'yuv{_subsampling}p{_bitdepth}le'
+
+# Preferred tag per pixel format, first one wins.
+_COLORSPACES = {}
+for _tag, _pix_fmt in _PIXEL_FORMATS.items():
+    _COLORSPACES.setdefault(_pix_fmt, _tag)
+
+# The colorspace assumed by the spec if the header has no C parameter.
+_DEFAULT_COLORSPACE = '420jpeg'
+
+
+class Y4MHeader(NamedTuple):
+    """Parameters of the stream header of a y4m file."""
+    width: int
+    height: int
+    pixel_format: str
+    framerate: Optional[Tuple[int, int]] = None
+    interlacing: str = '?'
+    aspect: Tuple[int, int] = (0, 0)
+    params: Tuple[str, ...] = ()
+
+    def to_bytes(self) -> bytes:
+        if self.pixel_format not in _COLORSPACES:
+            raise ValueError(f"The pixel format '{self.pixel_format}' cannot be stored in y4m files, "
+                             f"use one of {tuple(_COLORSPACES)}.")
+        tokens = [_SIGNATURE.decode(), f'W{self.width}', f'H{self.height}']
+        if self.framerate is not None:
+            tokens.append('F{}:{}'.format(*self.framerate))
+        tokens += [f'I{self.interlacing}', 'A{}:{}'.format(*self.aspect), f'C{_COLORSPACES[self.pixel_format]}']
+        tokens += list(self.params)
+        return (' '.join(tokens) + '\n').encode('ascii')
+
+
+def _ratio(value: str) -> Tuple[int, int]:
+    numerator, denominator = value.split(':')
+    return int(numerator), int(denominator)
+
+
+def parse_header(line: bytes) -> Y4MHeader:
+    """Parse the stream header line of a y4m file."""
+    tokens = line.decode('ascii').split()
+    if not tokens or tokens[0] != _SIGNATURE.decode():
+        raise ValueError("Not a y4m stream, the header does not start with '{}'.".format(_SIGNATURE.decode()))
+    values = {'C': _DEFAULT_COLORSPACE}
+    params = []
+    for token in tokens[1:]:
+        if token[0] in 'WHFIAC':
+            values[token[0]] = token[1:]
+        else:
+            params.append(token)
+    if 'W' not in values or 'H' not in values:
+        raise ValueError("The y4m header '{}' has no frame size.".format(line.decode('ascii').strip()))
+    if values['C'] not in _PIXEL_FORMATS:
+        raise ValueError(f"Unsupported y4m colorspace '{values['C']}', use one of {tuple(_PIXEL_FORMATS)}.")
+    return Y4MHeader(int(values['W']), int(values['H']), _PIXEL_FORMATS[values['C']],
+                     framerate=_ratio(values['F']) if 'F' in values else None,
+                     interlacing=values.get('I', '?'),
+                     aspect=_ratio(values['A']) if 'A' in values else (0, 0),
+                     params=tuple(params))
+
+
+class Y4MReader(Reader):
+    """Reader for y4m files and streams.
+
+    The pixel format and resolution are taken from the stream header. For random
+    access, the byte offsets of all frames are indexed in one scan over the frame
+    headers when the file is opened. If index_file is given, the index is loaded from
+    it if it matches the file, otherwise it is stored there after the scan. Memory
+    mapping requires frame headers of the same length, which is the common case."""
+
+    def __init__(self, file: Union[Path, str, io.RawIOBase, io.BufferedIOBase],
+                 mmap: bool = False, max_bytes: Optional[int] = None, threads: int = 1,
+                 native_endian: bool = False, index_file: Union[Path, str, None] = None):
+        if isinstance(file, io.RawIOBase) or isinstance(file, io.BufferedIOBase):
+            close = False
+        else:
+            close = True
+            file = open(Path(file).expanduser().resolve(), 'rb')
+        self._header = parse_header(file.readline())
+        self._data_offset = file.tell() if file.seekable() else None
+        self._index_file = index_file
+        self._offsets = None
+        format = pixel_formats.get(self._header.pixel_format, self._header.width, self._header.height)
+        super().__init__(file, format, mmap=mmap, max_bytes=max_bytes, threads=threads,
+                         native_endian=native_endian)
+        self._close = close
+
+    @property
+    def header(self) -> Y4MHeader:
+        return self._header
+
+    @property
+    def offsets(self) -> Optional[np.ndarray]:
+        """Byte offsets of the frame data of all frames, None for non-seekable streams."""
+        return self._offsets
+
+    def _file_signature(self):
+        try:
+            stat = os.fstat(self._file.fileno())
+            return stat.st_size, stat.st_mtime_ns
+        except (AttributeError, io.UnsupportedOperation):
+            stream_pos = self._file.tell()
+            size = self._file.seek(0, io.SEEK_END)
+            self._file.seek(stream_pos, io.SEEK_SET)
+            return size, 0
+
+    def _length_from_stream(self):
+        signature = self._file_signature()
+        if self._index_file is not None:
+            index_file = Path(self._index_file).expanduser()
+            if index_file.exists():
+                index = np.load(index_file)
+                if tuple(index[:2]) == signature:
+                    self._offsets = index[2:]
+                    return len(self._offsets)
+        stream_pos = self._file.tell()
+        self._offsets = self._scan_offsets(signature[0])
+        self._file.seek(stream_pos, io.SEEK_SET)
+        if self._index_file is not None:
+            with open(Path(self._index_file).expanduser(), 'wb') as index_file:
+                np.save(index_file, np.concatenate((np.array(signature, dtype=np.int64), self._offsets)))
+        return len(self._offsets)
+
+    def _scan_offsets(self, size):
+        """Offsets of the frame data of all complete frames, found by reading only the frame headers."""
+        itemsize = self._format.layout.itemsize
+        offsets = []
+        position = self._data_offset
+        while True:
+            self._file.seek(position, io.SEEK_SET)
+            line = self._file.readline()
+            if not line:
+                break
+            self._validate_frame_header(line, len(offsets))
+            position += len(line)
+            if position + itemsize > size:
+                break
+            offsets.append(position)
+            position += itemsize
+        return np.array(offsets, dtype=np.int64)
+
+    def _validate_frame_header(self, line, index):
+        if not line.startswith(_FRAME_MARKER) or not line.endswith(b'\n'):
+            raise ValueError("Invalid header of frame '{}' in y4m stream '{}'.".format(index, self.name))
+
+    def _map_stream(self):
+        if self._length == 0:
+            return np.empty(0, dtype=self._format.layout.dtype)
+        itemsize = self._format.layout.itemsize
+        strides = np.diff(self._offsets)
+        header_size = int(self._offsets[0] - self._data_offset)
+        if len(strides) > 0 and not np.all(strides == header_size + itemsize):
+            raise ValueError("Cannot memory map '{}', its frame headers differ in length.".format(self.name))
+        # Frames with their headers are mapped as records, the returned view skips the headers.
+        record = np.dtype({'names': ['frame'], 'formats': [self._format.layout.dtype],
+                           'offsets': [header_size], 'itemsize': header_size + itemsize})
+        try:
+            self._file.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            raise ValueError("Cannot memory map '{}', the stream is not backed "
+                             "by a file descriptor.".format(self.name))
+        data = np.memmap(self._file, dtype=record, mode='r', offset=self._data_offset, shape=(self._length,))
+        return data.view(np.ndarray)['frame']
+
+    def _frame_offset(self, index):
+        return int(self._offsets[index])
+
+    def _read_frames_into(self, index, out):
+        for i, offset in enumerate(self._offsets[index:index + len(out)]):
+            self._file.seek(int(offset), io.SEEK_SET)
+            self._readinto(out[i:i + 1].data)
+
+    def _read_stream_frames(self, out):
+        itemsize = self._format.layout.itemsize
+        for i in range(len(out)):
+            line = self._file.readline()
+            if not line:
+                return i
+            self._validate_frame_header(line, self._position + i)
+            if self._readinto(out[i:i + 1].data) < itemsize:
+                return i
+        return len(out)
+
+
+class Y4MWriter(Writer):
+    """Writer for y4m files and streams. The stream header is written on construction."""
+
+    def __init__(self, file, format: Format, framerate: Tuple[int, int] = (25, 1),
+                 interlacing: str = 'p', aspect: Tuple[int, int] = (0, 0),
+                 params: Tuple[str, ...] = (), threads: int = 1):
+        self._close = False
+        width, height = format.resolution
+        self._header = Y4MHeader(width, height, format.identifier(), framerate, interlacing, aspect, tuple(params))
+        header = self._header.to_bytes()
+        super().__init__(file, format, threads=threads)
+        self._write(header)
+
+    @property
+    def header(self) -> Y4MHeader:
+        return self._header
+
+    def _write_frames(self, data: np.ndarray):
+        buffers = []
+        for i in range(len(data)):
+            buffers += [_FRAME_MARKER + b'\n', data[i:i + 1]]
+        self._write_buffers(buffers)
+
+    def _frame_buffers(self, planes: List[np.ndarray]) -> List:
+        return [_FRAME_MARKER + b'\n'] + planes
@@ -97,3 +97,64 @@ class YUVFrame:
 
     def split(self):
         return self._y, self._u, self._v
+
+
+class YUVBatch:
+    """YUVBatch holds a batch of yuv/ycbcr frames as one stacked array per component."""
+
+    def __init__(self, y: np.ndarray,
+                 u: Optional[np.ndarray],
+                 v: Optional[np.ndarray],
+                 yuv_format: Format):
+        self._y = y
+        self._u = u
+        self._v = v
+        self._yuv_format = yuv_format
+
+    @property
+    def pixel_format(self):
+        return self._yuv_format.identifier()
+
+    @property
+    def yuv_format(self):
+        return self._yuv_format
+
+    @property
+    def resolution(self):
+        return self._y.shape[2], self._y.shape[1]
+
+    @property
+    def y(self):
+        return self._y
+
+    @property
+    def u(self):
+        return self._u
+
+    @property
+    def v(self):
+        return self._v
+
+    @property
+    def cb(self):
+        return self._u
+
+    @property
+    def cr(self):
+        return self._v
+
+    def __len__(self):
+        return self._y.shape[0]
+
+    def __getitem__(self, index: int) -> YUVFrame:
+        return YUVFrame(self._y[index],
+                        self._u[index] if self._u is not None else None,
+                        self._v[index] if self._v is not None else None,
+                        self._yuv_format)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def split(self):
+        return self._y, self._u, self._v
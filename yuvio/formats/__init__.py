@@ -25,3 +25,4 @@ from .yuv444p import (YUV444P,
                       YUV444P12LE, YUV444P12BE,
                       YUV444P14LE, YUV444P14BE)
 from .yuyv422 import (YUYV422, UYVY422, YVYU422)
+from . import conversions
@@ -0,0 +1,81 @@
+"""Fused converters between related formats that skip unpacking to separate components."""
+import numpy as np
+from ..core import converters
+from ..core.format import reshaped_view
+
+
+def _interleaved_to_interleaved(data, src_format, dst_format):
+    src_names = src_format.layout['frame'].dtype.names
+    dst_names = dst_format.layout['frame'].dtype.names
+    order = [src_names.index(name) for name in dst_names]
+    out = np.empty(data.shape[0], dtype=dst_format.layout.dtype)
+    # One strided copy of all samples, shuffling the four bytes of every macropixel.
+    np.take(reshaped_view(np.ascontiguousarray(data).view(np.uint8), (-1, 4)), order, axis=1,
+            out=reshaped_view(out.view(np.uint8), (-1, 4)), mode='clip')
+    return out
+
+
+def _interleaved_to_planar(data, src_format, dst_format):
+    frames = data['frame']
+    out = np.empty(data.shape[0], dtype=dst_format.layout.dtype)
+    out['y'][:, :, 0::2] = frames['y0']
+    out['y'][:, :, 1::2] = frames['y1']
+    out['u'][:] = frames['u0']
+    out['v'][:] = frames['v0']
+    return out
+
+
+def _planar_to_interleaved(data, src_format, dst_format):
+    out = np.empty(data.shape[0], dtype=dst_format.layout.dtype)
+    frames = out['frame']
+    frames['y0'] = data['y'][:, :, 0::2]
+    frames['y1'] = data['y'][:, :, 1::2]
+    frames['u0'] = data['u']
+    frames['v0'] = data['v']
+    return out
+
+
+def _nv12_to_planar(data, src_format, dst_format):
+    out = np.empty(data.shape[0], dtype=dst_format.layout.dtype)
+    out['y'] = data['y']
+    out['u'] = data['uv'][:, :, 0::2]
+    out['v'] = data['uv'][:, :, 1::2]
+    return out
+
+
+def _planar_to_nv12(data, src_format, dst_format):
+    out = np.empty(data.shape[0], dtype=dst_format.layout.dtype)
+    out['y'] = data['y']
+    out['uv'][:, :, 0::2] = data['u']
+    out['uv'][:, :, 1::2] = data['v']
+    return out
+
+
+def _v210_to_planar(data, src_format, dst_format):
+    out = np.empty(data.shape[0], dtype=dst_format.layout.dtype)
+    # Decode every frame straight into the fields of the output frame.
+    for i in range(data.shape[0]):
+        frame = out[i:i + 1]
+        src_format.unpack(data[i:i + 1], out=(frame['y'], frame['u'], frame['v']))
+    return out
+
+
+def _planar_to_v210(data, src_format, dst_format):
+    out = np.empty(data.shape[0], dtype=dst_format.layout.dtype)
+    for i in range(data.shape[0]):
+        frame = data[i:i + 1]
+        dst_format.pack((frame['y'], frame['u'], frame['v']), out=out[i:i + 1])
+    return out
+
+
+_interleaved_422 = ('yuyv422', 'uyvy422', 'yvyu422')
+for _src in _interleaved_422:
+    for _dst in _interleaved_422:
+        if _src != _dst:
+            converters.register(_src, _dst, _interleaved_to_interleaved)
+    converters.register(_src, 'yuv422p', _interleaved_to_planar)
+    converters.register('yuv422p', _src, _planar_to_interleaved)
+converters.register('nv12', 'yuv420p', _nv12_to_planar)
+converters.register('yuv420p', 'nv12', _planar_to_nv12)
+converters.register('v210', 'yuv422p10le', _v210_to_planar)
+converters.register('yuv422p10le', 'v210', _planar_to_v210)
@@ -15,10 +15,13 @@ class _GrayBase(Format, ABC):
         return y, None, None
 
     def pack(self, yuv):
-        data = np.empty(yuv[0].shape[0], dtype=self.dtype)
+        data = np.empty(yuv[0].shape[0], dtype=self.layout.dtype)
         data['y'][:] = yuv[0]
         return data
 
+    def planes(self, yuv):
+        return self._contiguous_planes(yuv, ('y',))
+
 
 class Gray(_GrayBase):
     @staticmethod
@@ -31,7 +31,7 @@ class NV12(Format):
         return y, u, v
 
     def pack(self, yuv):
-        data = np.empty(yuv[0].shape[0], dtype=self.dtype)
+        data = np.empty(yuv[0].shape[0], dtype=self.layout.dtype)
         data['y'][:] = yuv[0]
         data['uv'][:, :, ::2] = yuv[1]
         data['uv'][:, :, 1::2] = yuv[2]
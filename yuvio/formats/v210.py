@@ -1,6 +1,21 @@
 import numpy as np
 from .. import pixel_formats
 from ..core import Format
+from ..core.format import reshaped_view
+from ..core.parallel import parallel_for
+
+
+# Components stored in the 10bit fields (bits 0-9, 10-19, 20-29) of the four 32bit words
+# of a v210 block of six pixels as (component, sample index within the block).
+_WORD_LAYOUT = (
+    ((1, 0), (0, 0), (2, 0)),  # word0: cb0, y0, cr0
+    ((0, 1), (1, 1), (0, 2)),  # word1: y1, cb1, y2
+    ((2, 1), (0, 3), (1, 2)),  # word2: cr1, y3, cb2
+    ((0, 4), (2, 2), (0, 5)),  # word3: y4, cr2, y5
+)
+
+# Number of blocks processed at once, keeps the words being worked on in cache.
+_BLOCKS_PER_PASS = 1 << 15
 
 
 class V210(Format):
@@ -28,56 +43,66 @@ class V210(Format):
              ((self._height * self._width) // 6))
         ])
 
-    def unpack(self, data):
-        word0 = data['frame']['word0']
-        cr0 = np.right_shift(np.bitwise_and(word0, (0x3ff << 20)), 20).astype(np.uint16)
-        y0 = np.right_shift(np.bitwise_and(word0, (0x3ff << 10)), 10).astype(np.uint16)
-        cb0 = np.bitwise_and(word0, 0x3ff).astype(np.uint16)
-
-        word1 = data['frame']['word1']
-        y2 = np.right_shift(np.bitwise_and(word1, (0x3ff << 20)), 20).astype(np.uint16)
-        cb1 = np.right_shift(np.bitwise_and(word1, (0x3ff << 10)), 10).astype(np.uint16)
-        y1 = np.bitwise_and(word1, 0x3ff).astype(np.uint16)
+    def _words(self, data):
+        """View the frames as (blocks, 4) little endian words."""
+        return reshaped_view(np.ascontiguousarray(data).view('<u4'), (-1, 4))
 
-        word2 = data['frame']['word2']
-        cb2 = np.right_shift(np.bitwise_and(word2, (0x3ff << 20)), 20).astype(np.uint16)
-        y3 = np.right_shift(np.bitwise_and(word2, (0x3ff << 10)), 10).astype(np.uint16)
-        cr1 = np.bitwise_and(word2, 0x3ff).astype(np.uint16)
+    def unpack(self, data, out=None):
+        """Unpack the frames, optionally into the preallocated (y, u, v) uint16 planes in out."""
+        return self.unpack_threaded(data, 1, out)
 
-        word3 = data['frame']['word3']
-        y5 = np.right_shift(np.bitwise_and(word3, (0x3ff << 20)), 20).astype(np.uint16)
-        cr2 = np.right_shift(np.bitwise_and(word3, (0x3ff << 10)), 10).astype(np.uint16)
-        y4 = np.bitwise_and(word3, 0x3ff).astype(np.uint16)
+    def unpack_threaded(self, data, threads, out=None):
+        count = data.shape[0]
+        if out is None:
+            out = (np.empty((count, self._height, self._width), dtype=np.uint16),
+                   np.empty((count, self._height, self._width // 2), dtype=np.uint16),
+                   np.empty((count, self._height, self._width // 2), dtype=np.uint16))
+        words = self._words(data)
+        planes = (reshaped_view(out[0], (-1, 6)),
+                  reshaped_view(out[1], (-1, 3)),
+                  reshaped_view(out[2], (-1, 3)))
+        parallel_for(lambda start, stop: self._unpack_blocks(words, planes, start, stop), len(words), threads)
+        return out
 
-        y = np.stack((y0, y1, y2, y3, y4, y5), 2).reshape((-1, self._height, self._width))
-        u = np.stack((cb0, cb1, cb2), 2).reshape((-1, self._height, self._width // 2))
-        v = np.stack((cr0, cr1, cr2), 2).reshape((-1, self._height, self._width // 2))
+    @staticmethod
+    def _unpack_blocks(words, planes, start, stop):
+        buffer = np.empty(min(stop - start, _BLOCKS_PER_PASS), dtype=np.uint32)
+        for block_start in range(start, stop, _BLOCKS_PER_PASS):
+            block_stop = min(block_start + _BLOCKS_PER_PASS, stop)
+            sample = buffer[:block_stop - block_start]
+            for word_index, fields in enumerate(_WORD_LAYOUT):
+                word = words[block_start:block_stop, word_index]
+                for shift, (component, index) in zip((0, 10, 20), fields):
+                    np.right_shift(word, shift, out=sample)
+                    np.bitwise_and(sample, 0x3ff, out=sample)
+                    np.copyto(planes[component][block_start:block_stop, index], sample, casting='unsafe')
 
-        return y, u, v
+    def pack(self, yuv, out=None):
+        """Pack the (y, u, v) planes, optionally into the preallocated frames in out."""
+        return self.pack_threaded(yuv, 1, out)
 
-    def pack(self, yuv):
+    def pack_threaded(self, yuv, threads, out=None):
         y, u, v = yuv
-        y = y.reshape((-1, (self._height * self._width) // 6, 6))
-        u = u.reshape((-1, (self._height * self._width) // 6, 3))
-        v = v.reshape((-1, (self._height * self._width) // 6, 3))
-        y0, y1, y2, y3, y4, y5 = y[:, :, 0], y[:, :, 1], y[:, :, 2], y[:, :, 3], y[:, :, 4], y[:, :, 5]
-        cb0, cb1, cb2 = u[:, :, 0], u[:, :, 1], u[:, :, 2]
-        cr0, cr1, cr2 = v[:, :, 0], v[:, :, 1], v[:, :, 2]
-
-        data = np.empty(y.shape[0], dtype=self.dtype)
-        data['frame']['word0'] = np.left_shift(cr0.astype(np.uint32), 20) \
-                                 + np.left_shift(y0.astype(np.uint32), 10) \
-                                 + cb0.astype(np.uint32)
-        data['frame']['word1'] = np.left_shift(y2.astype(np.uint32), 20) \
-                                 + np.left_shift(cb1.astype(np.uint32), 10) \
-                                 + y1.astype(np.uint32)
-        data['frame']['word2'] = np.left_shift(cb2.astype(np.uint32), 20) \
-                                 + np.left_shift(y3.astype(np.uint32), 10) \
-                                 + cr1.astype(np.uint32)
-        data['frame']['word3'] = np.left_shift(y5.astype(np.uint32), 20) \
-                                 + np.left_shift(cr2.astype(np.uint32), 10) \
-                                 + y4.astype(np.uint32)
+        planes = (y.reshape((-1, 6)), u.reshape((-1, 3)), v.reshape((-1, 3)))
+        data = np.empty(y.shape[0], dtype=self.layout.dtype) if out is None else out
+        words = self._words(data)
+        if not np.shares_memory(words, data):
+            raise ValueError("The output frames for packing must be contiguous.")
+        parallel_for(lambda start, stop: self._pack_blocks(words, planes, start, stop), len(words), threads)
         return data
 
+    @staticmethod
+    def _pack_blocks(words, planes, start, stop):
+        for block_start in range(start, stop, _BLOCKS_PER_PASS):
+            block_stop = min(block_start + _BLOCKS_PER_PASS, stop)
+            for word_index, fields in enumerate(_WORD_LAYOUT):
+                word = words[block_start:block_stop, word_index]
+                component, index = fields[2]
+                np.copyto(word, planes[component][block_start:block_stop, index], casting='unsafe')
+                for component, index in (fields[1], fields[0]):
+                    np.left_shift(word, 10, out=word)
+                    np.bitwise_or(word, planes[component][block_start:block_stop, index],
+                                  out=word, casting='unsafe')
+
 
 pixel_formats.register(V210)
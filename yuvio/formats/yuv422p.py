@@ -17,12 +17,15 @@ class _YUV422PBase(Format, ABC):
         return y, u, v
 
     def pack(self, yuv):
-        data = np.empty(yuv[0].shape[0], dtype=self.dtype)
+        data = np.empty(yuv[0].shape[0], dtype=self.layout.dtype)
         data['y'][:] = yuv[0]
         data['u'][:] = yuv[1]
         data['v'][:] = yuv[2]
         return data
 
+    def planes(self, yuv):
+        return self._contiguous_planes(yuv, ('y', 'u', 'v'))
+
 
 class YUV422P(_YUV422PBase):
     @staticmethod
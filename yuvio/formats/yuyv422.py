@@ -2,6 +2,8 @@ from abc import ABC
 import numpy as np
 from .. import pixel_formats
 from ..core import Format
+from ..core.format import reshaped_view
+from ..core.parallel import parallel_for
 
 
 class _Interleaved422Base(Format, ABC):
@@ -19,7 +21,7 @@ class _Interleaved422Base(Format, ABC):
 
     def pack(self, yuv):
         y, u, v = yuv
-        data = np.empty(y.shape[0], dtype=self.dtype)
+        data = np.empty(y.shape[0], dtype=self.layout.dtype)
         y = y.reshape((-1, self._height, self._width // 2, 2))
         y0, y1 = y[:, :, :, 0], y[:, :, :, 1]
         data['frame']['y0'][:] = y0
@@ -28,6 +30,37 @@ class _Interleaved422Base(Format, ABC):
         data['frame']['v0'][:] = v
         return data
 
+    def unpack_threaded(self, data, threads):
+        frames = data['frame']
+        y = np.empty((data.shape[0], self._height, self._width), dtype=frames['y0'].dtype)
+        y_rows = reshaped_view(y, (-1, self._width))
+        y0 = frames['y0'].reshape((-1, self._width // 2))
+        y1 = frames['y1'].reshape((-1, self._width // 2))
+
+        def unpack_rows(start, stop):
+            y_rows[start:stop, 0::2] = y0[start:stop]
+            y_rows[start:stop, 1::2] = y1[start:stop]
+
+        parallel_for(unpack_rows, len(y_rows), threads)
+        return y, frames['u0'], frames['v0']
+
+    def pack_threaded(self, yuv, threads):
+        y, u, v = yuv
+        data = np.empty(y.shape[0], dtype=self.layout.dtype)
+        rows = reshaped_view(data['frame'], (-1, self._width // 2))
+        y = y.reshape((-1, self._width))
+        u = u.reshape((-1, self._width // 2))
+        v = v.reshape((-1, self._width // 2))
+
+        def pack_rows(start, stop):
+            rows['y0'][start:stop] = y[start:stop, 0::2]
+            rows['u0'][start:stop] = u[start:stop]
+            rows['y1'][start:stop] = y[start:stop, 1::2]
+            rows['v0'][start:stop] = v[start:stop]
+
+        parallel_for(pack_rows, len(rows), threads)
+        return data
+
 
 class YUYV422(_Interleaved422Base):
     @staticmethod